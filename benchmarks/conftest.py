@@ -0,0 +1,21 @@
+import pytest
+import yaml
+
+from cvrp_experiments import cvrp, synthetic
+
+NUM_CELLS = [10, 50, 100]
+
+
+@pytest.fixture(scope="session", params=NUM_CELLS, ids=lambda n: f"{n}_cells")
+def snapshot(request) -> dict:
+  return synthetic.make_snapshot(request.param)
+
+
+@pytest.fixture(scope="session")
+def snapshot_yaml(snapshot: dict) -> str:
+  return yaml.safe_dump(snapshot)
+
+
+@pytest.fixture(scope="session")
+def vrp_solver(snapshot: dict) -> cvrp.VrpSolver:
+  return cvrp.VrpSolver(snapshot, silent_mode=True)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from cvrp_experiments import cvrp, data, synthetic, types
+
+
+def test_path_distance_to(benchmark, vrp_solver):
+  path = vrp_solver._other_robot_global_paths[0]  # pylint: disable=protected-access
+  benchmark(path.distance_to, types.Position(50, 50, 0))
+
+
+def test_path_distances_to(benchmark, vrp_solver):
+  path = vrp_solver._other_robot_global_paths[0]  # pylint: disable=protected-access
+  points = np.random.default_rng(0).uniform(0, 100, (10_000, 2))
+  benchmark(path.distances_to, points)
+
+
+def test_get_connection_distance(benchmark, vrp_solver):
+  cell_ids = vrp_solver._cell_ids  # pylint: disable=protected-access
+  connections = vrp_solver._connections  # pylint: disable=protected-access
+  benchmark(connections.get_connection_distance, cell_ids[-1], False, cell_ids[0], False)
+
+
+def test_calc_distance_matrix(benchmark, vrp_solver):
+  benchmark(vrp_solver._calc_distance_matrix)  # pylint: disable=protected-access
+
+
+def test_calc_node_rewards(benchmark, vrp_solver):
+
+  def calc_node_rewards():
+    # Node rewards are cached per solver, so drop them to measure the belief evaluation as well
+    vrp_solver.invalidate_cache()
+    return vrp_solver._calc_node_rewards()  # pylint: disable=protected-access
+
+  benchmark(calc_node_rewards)
+
+
+def test_aggregated_belief_state_get_likelihood(benchmark, vrp_solver):
+  aggregated_belief_state = vrp_solver._aggregated_belief_state  # pylint: disable=protected-access
+  benchmark(aggregated_belief_state.get_likelihood, types.Position(50, 50, 0))
+
+
+def test_aggregated_belief_state_get_likelihoods(benchmark, vrp_solver):
+  aggregated_belief_state = vrp_solver._aggregated_belief_state  # pylint: disable=protected-access
+  points = np.random.default_rng(0).uniform(0, 100, (10_000, 2))
+  benchmark(aggregated_belief_state.get_likelihoods, points)
+
+
+def test_parse_log_line(benchmark, snapshot_yaml):
+  benchmark.pedantic(data.parse_log_line, (snapshot_yaml,), rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("snapshot", [10, 50], indirect=True, ids=lambda n: f"{n}_cells")
+def test_solve_with_path(benchmark, snapshot):
+
+  def solve_with_path():
+    return cvrp.VrpSolver(snapshot, silent_mode=True).solve_with_path()
+
+  benchmark.pedantic(solve_with_path, rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("num_cells", [10, 50], ids=lambda n: f"{n}_cells")
+def test_solve_routes_joint(benchmark, num_cells):
+  snapshot = synthetic.make_snapshot(num_cells, connect_all_robots=True)
+
+  def solve_routes():
+    return cvrp.VrpSolver(snapshot, silent_mode=True, joint=True).solve_routes()
+
+  benchmark.pedantic(solve_routes, rounds=3, iterations=1)
@@ -1,54 +1,146 @@
 # pylint: disable=too-many-locals,too-many-arguments
+import dataclasses
 import json
 import os
 from concurrent import futures
+from typing import Iterator
 
 import fire
 import tqdm
 
-from cvrp_experiments import cvrp, data
+from cvrp_experiments import cvrp, data, instrumentation, parallel, results, solution_cache
 
 OUTDIR = "tsp_solution_data"
+# Kept out of OUTDIR, which compare_tsp_solutions.py reads as final results only
+CHECKPOINT_DIR = "tsp_solution_checkpoints"
+TIMINGS_DIR = "tsp_solution_timings"
 
 
-def main(logs: str, output_filename: str) -> None:
+def main(
+    logs: str,
+    output_filename: str,
+    use_cache: bool = True,
+    first_solution_strategy: str = "PARALLEL_CHEAPEST_INSERTION",
+    local_search_metaheuristic: str = "GREEDY_DESCENT",
+    time_limit_s: float | None = None,
+    solution_limit: int | None = None,
+    max_workers: int | None = None,
+    resume: bool = False,
+    overwrite: bool = False,
+    solution_cache_dir: str | None = None,
+    instrument: bool = False,
+    portfolio: bool = False,
+) -> None:
+  """With `portfolio`, each snapshot is raced under every configuration of `cvrp.DEFAULT_PORTFOLIO` instead of the
+  given search options, sharing a budget of `time_limit_s`, and the best solution is kept."""
+  if portfolio and time_limit_s is None:
+    raise ValueError("--portfolio needs --time_limit_s, the time budget its configurations share per snapshot")
+  if portfolio and (solution_cache_dir or instrument):
+    raise ValueError("--portfolio can't be combined with --solution_cache_dir or --instrument")
   os.makedirs(OUTDIR, exist_ok=True)
-  logs = data.read_logs(logs)
-
-  distances: list[int] = []
-  rewards: list[int] = []
-  penalties: list[int] = []
-  rewards_evolution: list[list[int]] = []
-
-  pb = tqdm.tqdm(total=len(logs))
-  with futures.ProcessPoolExecutor(max_workers=8) as executor:
-    futures_ = [executor.submit(_solve_vrp, log) for log in logs]
-    for future in futures.as_completed(futures_):
-      distance, reward, penalty, reward_evolution = future.result()
-      distances.append(distance)
-      rewards.append(reward)
-      penalties.append(penalty)
-      rewards_evolution.append(reward_evolution)
-      pb.update(1)
+  os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+  search_options = cvrp.SearchOptions(first_solution_strategy, local_search_metaheuristic, time_limit_s, solution_limit)
+
+  # Results are checkpointed per snapshot, so an interrupted run can be continued with --resume. Starting over
+  # requires --overwrite
+  store_path = os.path.join(CHECKPOINT_DIR, os.path.splitext(output_filename)[0] + ".jsonl")
+  config = {"logs": os.path.abspath(logs), **dataclasses.asdict(search_options)}
+  if portfolio:
+    config["portfolio"] = [dataclasses.asdict(options) for options in cvrp.DEFAULT_PORTFOLIO]
+  store = results.ResultStore(store_path, config, resume, overwrite)
+  num_logs = data.prepare_snapshots(logs, use_cache)
+  remaining = [idx for idx in range(num_logs) if idx not in store]
+  cache = solution_cache.SolutionCache(solution_cache_dir) if solution_cache_dir else None
+
+  if portfolio:
+    solutions = _race_portfolios(logs, remaining, use_cache, time_limit_s)
+  else:
+    # Workers load snapshots by timestep from the cache or the log's persisted offset index, so no log text is pickled
+    args = ((logs, idx, use_cache, search_options, cache, instrument) for idx in remaining)
+    solutions = parallel.ordered_map(_solve_vrp, args, max_workers)
+  phase_records = []
+  for idx, solution in tqdm.tqdm(zip(remaining, solutions), total=num_logs, initial=num_logs - len(remaining)):
+    phase_records.extend(instrumentation.PhaseRecord(**record) for record in solution.pop("phase_timings", []))
+    store.add(idx, solution)
+
+  if instrument:
+    # Only snapshots solved in this run are timed; resumed results carry no timings
+    instrumentation.save_timings(TIMINGS_DIR, os.path.splitext(output_filename)[0], phase_records)
+
+  ordered_results = store.ordered_results()
+  distances = [result["distance"] for result in ordered_results]
+  rewards = [result["reward"] for result in ordered_results]
+  penalties = [result["penalty"] for result in ordered_results]
+  rewards_evolution = [result["reward_evolution"] for result in ordered_results]
+  incumbent_traces = [result["incumbent_trace"] for result in ordered_results]
+  output = {
+      "timesteps": sorted(store.results),
+      "distances": distances,
+      "rewards": rewards,
+      "penalties": penalties,
+      "rewards_evolution": rewards_evolution,
+      "incumbent_traces": incumbent_traces,
+  }
+  if portfolio:
+    output["search_options"] = [result["search_options"] for result in ordered_results]
 
   print("Distances:", distances)
   print("Rewards:", rewards, f"({sum(rewards)})")
   print("Rewards evolution:", rewards_evolution)
 
   with open(os.path.join(OUTDIR, output_filename), "w", encoding="utf-8") as f:
-    json.dump({
-        "distances": distances,
-        "rewards": rewards,
-        "penalties": penalties,
-        "rewards_evolution": rewards_evolution,
-    }, f, indent=2)
+    json.dump(output, f, indent=2)
 
 
-def _solve_vrp(log: str) -> tuple[int, int, int, list[int]]:
-  raw_data = data.parse_log_line(log)
-  vrp_solver = cvrp.VrpSolver(raw_data, True)
+def _solve_vrp(
+    logs: str,
+    idx: int,
+    use_cache: bool,
+    search_options: cvrp.SearchOptions,
+    cache: solution_cache.SolutionCache | None,
+    instrument: bool = False,
+) -> dict:
+  timer = instrumentation.PhaseTimer(idx, enabled=instrument)
+  vrp_solver = cvrp.VrpSolver.from_log(
+      logs, idx, use_cache, silent_mode=True, search_options=search_options, solution_cache=cache, timer=timer
+  )
   _ = vrp_solver.solve_with_path()
-  return vrp_solver.distance, vrp_solver.reward, vrp_solver.penalty, vrp_solver.reward_evolution
+  result = {
+      "distance": vrp_solver.distance,
+      "reward": vrp_solver.reward,
+      "penalty": vrp_solver.penalty,
+      "reward_evolution": vrp_solver.reward_evolution,
+      "incumbent_trace": vrp_solver.incumbent_trace,
+  }
+  if instrument:
+    result["phase_timings"] = [dataclasses.asdict(record) for record in timer.records]
+  return result
+
+
+def _race_portfolios(logs: str, timesteps: list[int], use_cache: bool, time_limit_s: float) -> Iterator[dict]:
+  # Snapshots are raced one after another, each with one worker per configuration
+  with futures.ProcessPoolExecutor(max_workers=len(cvrp.DEFAULT_PORTFOLIO)) as executor:
+    for idx in timesteps:
+      result = cvrp.solve_portfolio(data.load_snapshot(logs, idx, use_cache), time_limit_s, executor=executor)
+      if result is None:
+        # Like a single configuration that found no solution
+        yield {
+            "distance": 0,
+            "reward": 0,
+            "penalty": 0,
+            "reward_evolution": [],
+            "incumbent_trace": [],
+            "search_options": None,
+        }
+        continue
+      yield {
+          "distance": result.distance,
+          "reward": result.reward,
+          "penalty": result.penalty,
+          "reward_evolution": result.reward_evolution,
+          "incumbent_trace": result.incumbent_trace,
+          "search_options": dataclasses.asdict(result.search_options),
+      }
 
 
 if __name__ == "__main__":
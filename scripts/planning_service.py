@@ -0,0 +1,102 @@
+# pylint: disable=too-many-locals,too-many-arguments
+import json
+import os
+import signal
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import fire
+
+from cvrp_experiments import cvrp, data, service as service_
+
+OUTDIR = "planning_service"
+
+
+def serve(
+    socket_path: str | None = None,
+    max_workers: int | None = None,
+    max_sessions_per_worker: int = 16,
+    joint: bool = False,
+    first_solution_strategy: str = "PARALLEL_CHEAPEST_INSERTION",
+    local_search_metaheuristic: str = "GREEDY_DESCENT",
+    time_limit_s: float | None = None,
+    solution_limit: int | None = None,
+) -> None:
+  """Plans for JSON-lines requests from stdin, answering on stdout, or from the clients of a Unix socket."""
+  search_options = cvrp.SearchOptions(first_solution_strategy, local_search_metaheuristic, time_limit_s, solution_limit)
+  with service_.PlanningService(
+      max_workers, max_sessions_per_worker, search_options=search_options, joint=joint
+  ) as service:
+    if socket_path is None:
+
+      def write(line: str) -> None:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+      service_.serve_lines(service, sys.stdin, write)
+    else:
+      # Stopping the service with SIGTERM, e.g. from a process manager, still removes the socket
+      signal.signal(signal.SIGTERM, signal.default_int_handler)
+      print(f"Listening on {socket_path}", file=sys.stderr)
+      service_.serve_unix_socket(service, socket_path)
+
+
+def replay(
+    logs: str,
+    socket_path: str,
+    rate_hz: float = 1.0,
+    session: str = "replay",
+    use_cache: bool = True,
+    output_filename: str = "replay.json",
+) -> None:
+  """Stands in for the ROS bridge, sending each snapshot of a log to a running service at `rate_hz`.
+
+  Saves every response with its round trip latency, and prints latency statistics.
+  """
+  os.makedirs(OUTDIR, exist_ok=True)
+  num_logs = data.prepare_snapshots(logs, use_cache)
+  sent_times: dict[int, float] = {}
+  responses: list[dict] = []
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+    client.connect(socket_path)
+    reader = threading.Thread(target=_read_responses, args=(client.makefile("r"), sent_times, responses, num_logs))
+    reader.start()
+    start = time.perf_counter()
+    try:
+      for idx in range(num_logs):
+        # Snapshots are sent on a fixed schedule, however long the service takes to answer
+        time.sleep(max(0.0, start + idx / rate_hz - time.perf_counter()))
+        request = {"id": idx, "session": session, "snapshot": data.load_snapshot(logs, idx, use_cache)}
+        sent_times[idx] = time.perf_counter()
+        client.sendall((json.dumps(request, default=service_.json_default) + "\n").encode())
+    except OSError as e:
+      print(f"The service disconnected while sending snapshot {idx}: {e}", file=sys.stderr)
+      client.shutdown(socket.SHUT_RDWR)
+    reader.join()
+
+  responses.sort(key=lambda response: response.get("id", -1))
+  latencies = [response["latency_s"] for response in responses if "latency_s" in response]
+  errors = [response for response in responses if "error" in response]
+  if latencies:
+    print(f"Latency: median {statistics.median(latencies):.3f}s, max {max(latencies):.3f}s, ", end="")
+  print(f"{len(responses)} of {num_logs} snapshots answered, {len(errors)} errors")
+  with open(os.path.join(OUTDIR, output_filename), "w", encoding="utf-8") as f:
+    json.dump(responses, f, indent=2)
+
+
+def _read_responses(file, sent_times: dict[int, float], responses: list[dict], num_responses: int) -> None:
+  for line in file:
+    response = json.loads(line)
+    # Errors about requests that could not be read carry no id
+    if response.get("id") in sent_times:
+      response["latency_s"] = time.perf_counter() - sent_times[response["id"]]
+    responses.append(response)
+    if len(responses) == num_responses:
+      return
+
+
+if __name__ == "__main__":
+  fire.Fire({"serve": serve, "replay": replay})
@@ -0,0 +1,82 @@
+# pylint: disable=too-many-locals,too-many-arguments
+import json
+import os
+import resource
+import statistics
+import tracemalloc
+
+import fire
+import yaml
+
+from cvrp_experiments import cvrp, data, instrumentation, synthetic
+
+OUTDIR = "scaling_study"
+
+# Phases of instrumentation.PhaseTimer that don't overlap, in the order a snapshot goes through them. The solver's
+# connection_indexing is part of construct
+PHASES = ["parse", "construct", "distance_matrix", "rewards", "model_build", "search", "extraction", "path_assembly"]
+
+
+def main(
+    sizes: tuple[int, ...] = (25, 50, 100, 200),
+    num_robots: int = 3,
+    connection_density: float = 1.0,
+    poses_per_path: int = 5,
+    repeats: int = 3,
+    time_limit_s: float | None = None,
+    latency_target_s: float | None = None,
+    output_filename: str = "scaling_study.json",
+) -> None:
+  os.makedirs(OUTDIR, exist_ok=True)
+  search_options = cvrp.SearchOptions(time_limit_s=time_limit_s)
+  results = []
+  for num_cells in sizes:
+    snapshot = synthetic.make_snapshot(num_cells, num_robots, connection_density, poses_per_path)
+    log = yaml.safe_dump(snapshot)
+    runs = [_measure(log, search_options) for _ in range(repeats)]
+    # Tracing allocations slows down every phase, so peak memory is measured in a separate, untimed run
+    tracemalloc.start()
+    _measure(log, search_options)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "num_cells": num_cells,
+        "num_connections": len(snapshot["connections"]),
+        **{phase: statistics.median(run[phase] for run in runs) for phase in PHASES},
+        "peak_traced_memory_mb": peak / 1024**2,
+    }
+    result["total"] = sum(result[phase] for phase in PHASES)
+    results.append(result)
+    _print_result(result, latency_target_s)
+
+  print(f"Max resident set size: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+  with open(os.path.join(OUTDIR, output_filename), "w", encoding="utf-8") as f:
+    json.dump({"latency_target_s": latency_target_s, "results": results}, f, indent=2)
+
+
+def _measure(log: str, search_options: cvrp.SearchOptions) -> dict:
+  """Runs one snapshot through every phase, returning each phase's wall time."""
+  timer = instrumentation.PhaseTimer()
+  with timer.phase("parse"):
+    raw_data = data.parse_log_line(log)
+  with timer.phase("construct"):
+    vrp_solver = cvrp.VrpSolver(raw_data, True, search_options=search_options, timer=timer)
+  vrp_solver.route_to_path(vrp_solver.solve())
+  timings = dict.fromkeys(PHASES, 0.0)
+  for record in timer.records:
+    if record.phase in timings:
+      timings[record.phase] += record.duration
+  return timings
+
+
+def _print_result(result: dict, latency_target_s: float | None) -> None:
+  phases = ", ".join(f"{phase} {result[phase]:.3f}s" for phase in PHASES)
+  line = f"{result['num_cells']} cells ({result['num_connections']} connections): total {result['total']:.3f}s, "
+  line += f"{phases}, peak {result['peak_traced_memory_mb']:.1f} MB"
+  if latency_target_s is not None and result["total"] > latency_target_s:
+    line += f" [exceeds {latency_target_s}s target]"
+  print(line)
+
+
+if __name__ == "__main__":
+  fire.Fire(main)
@@ -1,39 +1,115 @@
 # pylint: disable=too-many-locals,too-many-arguments
+import functools
 import os
 
 import fire
 import matplotlib.pyplot as plt
 from tqdm.contrib.concurrent import process_map  # pylint: disable=only-importing-modules-is-allowed
 
-from cvrp_experiments import belief_state, data, types, visualization, cvrp
+from cvrp_experiments import (
+    belief_state, data, instrumentation, solution_cache, types, visualization, cvrp, video as video_
+)
 
 OUTDIR = "cvrp_solutions"
+TIMINGS_DIR = "cvrp_solution_timings"
+# (xmin, xmax, ymin, ymax) of the belief heatmap
+HEATMAP_LIMITS = (-20, 80, -20, 100)
+TITLE = "Solution to the TSP problem with constraints and rewards"
 
 
 def main(
     logs: str,
     timestep: int,
+    use_cache: bool = True,
+    solution_cache_dir: str | None = None,
+    heatmap_limits: tuple[float, float, float, float] = HEATMAP_LIMITS,
+    heatmap_resolution: int = 100,
+    video: str | None = None,
+    fps: float = 5,
+    instrument: bool = False,
 ) -> None:
+  """With `instrument`, the time spent in each phase of every timestep is saved to TIMINGS_DIR."""
   os.makedirs(OUTDIR, exist_ok=True)
-  logs = data.read_logs(logs)
-
-  if timestep == -1:
-    idx_and_logs = list(enumerate(logs))
-    process_map(plot_and_save, idx_and_logs, max_workers=8)
+  cache = solution_cache.SolutionCache(solution_cache_dir) if solution_cache_dir else None
+  if timestep != -1 and not video:
+    records = plot_and_save(timestep, logs, use_cache=False, cache=cache, heatmap_limits=heatmap_limits,
+                            heatmap_resolution=heatmap_resolution, instrument=instrument)
+    if instrument:
+      instrumentation.save_timings(TIMINGS_DIR, f"vrp_solution_{timestep}", records)
+    return
+  num_logs = data.prepare_snapshots(logs, use_cache)
+
+  if video:
+    make_renderer = functools.partial(
+        visualization.FrameRenderer,
+        TITLE,
+        list(heatmap_limits),
+        heatmap_resolution,
+        path_color="#0000AA",
+        path_end_color="#A6FFFB",
+        path_label="TSP problem solution",
+        other_path_label="Other robot path",
+    )
+    make_frame_ = functools.partial(make_frame, logs=logs, use_cache=use_cache, cache=cache)
+    records = video_.render_video(
+        os.path.join(OUTDIR, video), make_frame_, num_logs, make_renderer, fps, max_workers=8, instrument=instrument
+    )
+    stem = os.path.splitext(video)[0]
   else:
-    plot_and_save((timestep, logs[timestep]))
-
-
-def plot_and_save(idx_and_log: tuple[int, str]) -> None:
+    plot_and_save_ = functools.partial(
+        plot_and_save,
+        logs=logs,
+        use_cache=use_cache,
+        cache=cache,
+        heatmap_limits=heatmap_limits,
+        heatmap_resolution=heatmap_resolution,
+        instrument=instrument,
+    )
+    timestep_records = process_map(plot_and_save_, range(num_logs), max_workers=8)
+    records = [record for records_ in timestep_records for record in records_]
+    stem = "vrp_solutions"
+  if instrument:
+    instrumentation.save_timings(TIMINGS_DIR, stem, records)
+
+
+def plot_and_save(
+    idx: int,
+    logs: str,
+    use_cache: bool,
+    cache: solution_cache.SolutionCache | None = None,
+    heatmap_limits: tuple[float, float, float, float] = HEATMAP_LIMITS,
+    heatmap_resolution: int = 100,
+    instrument: bool = False,
+) -> list[instrumentation.PhaseRecord]:
+  timer = instrumentation.PhaseTimer(idx, enabled=instrument)
   plt.clf()
-  idx, log = idx_and_log
-  raw_data = data.parse_log_line(log)
-  extracted_data = extract_data(raw_data)
-  vrp_solver = cvrp.VrpSolver(raw_data, True)
+  with timer.phase("parse"):
+    raw_data = data.load_snapshot(logs, idx, use_cache)
+    extracted_data = extract_data(raw_data)
+  vrp_solver = cvrp.VrpSolver(raw_data, True, solution_cache=cache, timer=timer)
   vrp_solution = vrp_solver.solve_with_path()
   outpath = os.path.join(OUTDIR, f"vrp_solution_{idx}.png")
-  generate_figure(*extracted_data, vrp_solution)
-  plt.savefig(outpath, bbox_inches='tight', pad_inches=0.1)
+  with timer.phase("plot"):
+    generate_figure(*extracted_data, vrp_solution, heatmap_limits, heatmap_resolution)
+    plt.savefig(outpath, bbox_inches='tight', pad_inches=0.1)
+  return timer.records
+
+
+def make_frame(
+    idx: int,
+    logs: str,
+    use_cache: bool,
+    cache: solution_cache.SolutionCache | None = None,
+) -> visualization.Frame:
+  raw_data = data.load_snapshot(logs, idx, use_cache)
+  current_robot, other_robots, _, other_robot_global_paths, cells, times_since_last_update, _ = extract_data(raw_data)
+  vrp_solution = cvrp.VrpSolver(raw_data, True, solution_cache=cache).solve_with_path()
+  aggregated_belief_state = belief_state.calc_aggregated_belief_state(
+      other_robots, other_robot_global_paths, times_since_last_update
+  )
+  return visualization.Frame(
+      current_robot, other_robots, other_robot_global_paths, cells, vrp_solution, aggregated_belief_state
+  )
 
 
 def extract_data(
@@ -66,13 +142,14 @@ def generate_figure(
     times_since_last_update: list[float],
     connections: list[types.Connection],
     cvrp_solution: types.Path,
+    heatmap_limits: tuple[float, float, float, float] = HEATMAP_LIMITS,
+    heatmap_resolution: int = 100,
 ) -> None:
-  belief_states = []
-  for robot, path, time in zip(other_robots, other_robot_global_paths, times_since_last_update):
-    belief_states.append(belief_state.BeliefState(robot, path, time / 1000 * 2))
-  aggregated_belief_state = belief_state.AggregatedBeliefState(belief_states)
+  aggregated_belief_state = belief_state.calc_aggregated_belief_state(
+      other_robots, other_robot_global_paths, times_since_last_update
+  )
 
-  visualization.plot_heatmap(aggregated_belief_state, [-20, 80, -20, 100])
+  visualization.plot_heatmap(aggregated_belief_state, list(heatmap_limits), heatmap_resolution)
 
   for path in other_robot_global_paths:
     visualization.plot_path(path, "r", label="Other robot path")
@@ -91,7 +168,7 @@ def generate_figure(
   plt.gca().set_xticklabels([])
   plt.gca().set_yticklabels([])
   plt.gca().tick_params(axis='both', which='both', length=0)
-  plt.title("Solution to the TSP problem with constraints and rewards")
+  plt.title(TITLE)
   plt.tight_layout()
   # ax = plt.gca()
   # ax.set_xlim([-20, 80])
@@ -1,37 +1,98 @@
 # pylint: disable=too-many-locals,too-many-arguments
+import functools
 import os
 
 import fire
 import matplotlib.pyplot as plt
 from tqdm.contrib.concurrent import process_map  # pylint: disable=only-importing-modules-is-allowed
 
-from cvrp_experiments import belief_state, data, types, visualization
+from cvrp_experiments import belief_state, data, instrumentation, types, visualization, video as video_
 
 OUTDIR = "belief_states"
+TIMINGS_DIR = "belief_state_timings"
+# (xmin, xmax, ymin, ymax) of the belief heatmap
+HEATMAP_LIMITS = (-25, 80, -25, 100)
+TITLE = "Cost Map Visualization: Movement Cost Calculated\nfrom Positions and Plans of Other Robots"
 
 
 def main(
     logs: str,
     timestep: int,
+    use_cache: bool = True,
+    heatmap_limits: tuple[float, float, float, float] = HEATMAP_LIMITS,
+    heatmap_resolution: int = 100,
+    video: str | None = None,
+    fps: float = 5,
+    instrument: bool = False,
 ) -> None:
+  """With `instrument`, the time spent in each phase of every timestep is saved to TIMINGS_DIR."""
   os.makedirs(OUTDIR, exist_ok=True)
-  logs = data.read_logs(logs)
-
-  if timestep == -1:
-    idx_and_logs = list(enumerate(logs))
-    process_map(plot_and_save, idx_and_logs, max_workers=8)
+  if timestep != -1 and not video:
+    records = plot_and_save(timestep, logs, use_cache=False, heatmap_limits=heatmap_limits,
+                            heatmap_resolution=heatmap_resolution, instrument=instrument)
+    if instrument:
+      instrumentation.save_timings(TIMINGS_DIR, f"belief_state_{timestep}", records)
+    return
+  num_logs = data.prepare_snapshots(logs, use_cache)
+
+  if video:
+    make_renderer = functools.partial(
+        visualization.FrameRenderer,
+        TITLE,
+        list(heatmap_limits),
+        heatmap_resolution,
+        other_path_label="Other robot's global plan",
+    )
+    make_frame_ = functools.partial(make_frame, logs=logs, use_cache=use_cache)
+    records = video_.render_video(
+        os.path.join(OUTDIR, video), make_frame_, num_logs, make_renderer, fps, max_workers=8, instrument=instrument
+    )
+    stem = os.path.splitext(video)[0]
   else:
-    plot_and_save((timestep, logs[timestep]))
-
-
-def plot_and_save(idx_and_log: tuple[int, str]) -> None:
+    plot_and_save_ = functools.partial(
+        plot_and_save,
+        logs=logs,
+        use_cache=use_cache,
+        heatmap_limits=heatmap_limits,
+        heatmap_resolution=heatmap_resolution,
+        instrument=instrument,
+    )
+    timestep_records = process_map(plot_and_save_, range(num_logs), max_workers=8)
+    records = [record for records_ in timestep_records for record in records_]
+    stem = "belief_states"
+  if instrument:
+    instrumentation.save_timings(TIMINGS_DIR, stem, records)
+
+
+def plot_and_save(
+    idx: int,
+    logs: str,
+    use_cache: bool,
+    heatmap_limits: tuple[float, float, float, float] = HEATMAP_LIMITS,
+    heatmap_resolution: int = 100,
+    instrument: bool = False,
+) -> list[instrumentation.PhaseRecord]:
+  timer = instrumentation.PhaseTimer(idx, enabled=instrument)
   plt.clf()
-  idx, log = idx_and_log
-  raw_data = data.parse_log_line(log)
-  extracted_data = extract_data(raw_data)
+  with timer.phase("parse"):
+    raw_data = data.load_snapshot(logs, idx, use_cache)
+    extracted_data = extract_data(raw_data)
   outpath = os.path.join(OUTDIR, f"vrp_solution_{idx}.png")
-  generate_figure(*extracted_data)
-  plt.savefig(outpath, bbox_inches='tight', pad_inches=0.1)
+  with timer.phase("plot"):
+    generate_figure(*extracted_data, heatmap_limits, heatmap_resolution)
+    plt.savefig(outpath, bbox_inches='tight', pad_inches=0.1)
+  return timer.records
+
+
+def make_frame(idx: int, logs: str, use_cache: bool) -> visualization.Frame:
+  raw_data = data.load_snapshot(logs, idx, use_cache)
+  current_robot, other_robots, _, other_robot_global_paths, cells, times_since_last_update, _ = extract_data(raw_data)
+  aggregated_belief_state = belief_state.calc_aggregated_belief_state(
+      other_robots, other_robot_global_paths, times_since_last_update
+  )
+  return visualization.Frame(
+      current_robot, other_robots, other_robot_global_paths, cells, aggregated_belief_state=aggregated_belief_state
+  )
 
 
 def extract_data(
@@ -63,13 +124,14 @@ def generate_figure(
     cells: list[types.Cell],
     times_since_last_update: list[float],
     connections: list[types.Connection],
+    heatmap_limits: tuple[float, float, float, float] = HEATMAP_LIMITS,
+    heatmap_resolution: int = 100,
 ) -> None:
-  belief_states = []
-  for robot, path, time in zip(other_robots, other_robot_global_paths, times_since_last_update):
-    belief_states.append(belief_state.BeliefState(robot, path, time / 1000 * 2))
-  aggregated_belief_state = belief_state.AggregatedBeliefState(belief_states)
+  aggregated_belief_state = belief_state.calc_aggregated_belief_state(
+      other_robots, other_robot_global_paths, times_since_last_update
+  )
 
-  visualization.plot_heatmap(aggregated_belief_state, [-25, 80, -25, 100])
+  visualization.plot_heatmap(aggregated_belief_state, list(heatmap_limits), heatmap_resolution)
   #
   # for connection in connections:
   #   visualization.plot_path(connection.path)
@@ -90,7 +152,7 @@ def generate_figure(
   plt.gca().set_xticklabels([])
   plt.gca().set_yticklabels([])
   plt.gca().tick_params(axis='both', which='both', length=0)
-  plt.title("Cost Map Visualization: Movement Cost Calculated\nfrom Positions and Plans of Other Robots")
+  plt.title(TITLE)
   plt.tight_layout()
 
 
@@ -1,34 +1,71 @@
+import functools
 import os
 
 import fire
 import matplotlib.pyplot as plt
 from tqdm.contrib.concurrent import process_map  # pylint: disable=only-importing-modules-is-allowed
 
-from cvrp_experiments import types, data, visualization
+from cvrp_experiments import types, data, instrumentation, visualization, video as video_
 
 OUTDIR = "VRP"
+TIMINGS_DIR = "VRP_timings"
+TITLE = "Solution to the VRP problem"
+LIMITS = [-20, 80, 0, 100]
 
 def main(
     logs: str,
     timestep: int,
+    use_cache: bool = True,
+    video: str | None = None,
+    fps: float = 5,
+    instrument: bool = False,
 ) -> None:
+  """With `instrument`, the time spent in each phase of every timestep is saved to TIMINGS_DIR."""
   os.makedirs(OUTDIR, exist_ok=True)
-  logs = data.read_logs(logs)
-
-  if timestep == -1:
-    idx_and_logs = list(enumerate(logs))
-    process_map(plot_and_save, idx_and_logs, max_workers=5)
+  if timestep != -1 and not video:
+    records = plot_and_save(timestep, logs, use_cache=False, instrument=instrument)
+    if instrument:
+      instrumentation.save_timings(TIMINGS_DIR, f"vrp_solution_{timestep}", records)
+    return
+  num_logs = data.prepare_snapshots(logs, use_cache)
+
+  if video:
+    make_renderer = functools.partial(visualization.FrameRenderer, TITLE, LIMITS)
+    make_frame_ = functools.partial(make_frame, logs=logs, use_cache=use_cache)
+    records = video_.render_video(
+        os.path.join(OUTDIR, video), make_frame_, num_logs, make_renderer, fps, max_workers=5, instrument=instrument
+    )
+    stem = os.path.splitext(video)[0]
   else:
-    plot_and_save((timestep, logs[timestep]))
+    plot_and_save_ = functools.partial(plot_and_save, logs=logs, use_cache=use_cache, instrument=instrument)
+    timestep_records = process_map(plot_and_save_, range(num_logs), max_workers=5)
+    records = [record for records_ in timestep_records for record in records_]
+    stem = "vrp_solutions"
+  if instrument:
+    instrumentation.save_timings(TIMINGS_DIR, stem, records)
 
 
-def plot_and_save(idx_and_log: tuple[int, str]) -> None:
+def plot_and_save(idx: int, logs: str, use_cache: bool, instrument: bool = False) -> list[instrumentation.PhaseRecord]:
+  timer = instrumentation.PhaseTimer(idx, enabled=instrument)
   plt.clf()
-  idx, log = idx_and_log
-  raw_data = data.parse_log_line(log)
-  generate_figure(raw_data)
-  outpath = os.path.join(OUTDIR, f"vrp_solution_{idx}.png")
-  plt.savefig(outpath, bbox_inches='tight', pad_inches=0.1)
+  with timer.phase("parse"):
+    raw_data = data.load_snapshot(logs, idx, use_cache)
+  with timer.phase("plot"):
+    generate_figure(raw_data)
+    outpath = os.path.join(OUTDIR, f"vrp_solution_{idx}.png")
+    plt.savefig(outpath, bbox_inches='tight', pad_inches=0.1)
+  return timer.records
+
+
+def make_frame(idx: int, logs: str, use_cache: bool) -> visualization.Frame:
+  raw_data = data.load_snapshot(logs, idx, use_cache)
+  return visualization.Frame(
+      types.Robot.from_dict(raw_data["robots"][0]),
+      [types.Robot.from_dict(i) for i in raw_data["robots"][1:]],
+      [types.Path.from_dict(i) for i in raw_data["other_robot_global_paths"]],
+      [types.Cell.from_dict(i) for i in raw_data["cells"]],
+      types.Path.from_dict(raw_data["global_path"]),
+  )
 
 
 def generate_figure(raw_data):
@@ -60,11 +97,11 @@ def generate_figure(raw_data):
   plt.gca().set_xticklabels([])
   plt.gca().set_yticklabels([])
   plt.gca().tick_params(axis='both', which='both', length=0)
-  plt.title("Solution to the VRP problem")
+  plt.title(TITLE)
   plt.tight_layout()
   ax = plt.gca()
-  ax.set_xlim([-20, 80])
-  ax.set_ylim([0, 100])
+  ax.set_xlim(LIMITS[:2])
+  ax.set_ylim(LIMITS[2:])
 
 
 if __name__ == "__main__":
@@ -2,6 +2,9 @@ import numpy as np
 
 from cvrp_experiments import types
 
+# Queries with at most this many point-segment pairs measure every segment, which is cheaper than building the grid
+_MAX_DIRECT_QUERY_PAIRS = 1 << 14
+
 
 class BeliefState:
   SIGMA = 5
@@ -12,19 +15,44 @@ class BeliefState:
     self.robot = robot
     self.global_plan = global_plan
     self.limit = limit
+    self._segment_grid: types.SegmentGrid | None = None
 
   def update(self, robot: types.Robot, global_plan: types.Path, limit: float):
     self.robot = robot
     self.global_plan = global_plan
     self.limit = limit
+    self._segment_grid = None
 
   def get_likelihood(self, position: types.Position):
-    dist_to_path = self.global_plan.distance_to(position)
-    dist_to_robot = self.robot.position.distance_to(position)
-    dist = min(dist_to_path, dist_to_robot)
-    if dist > self.limit:
-      return 0
-    return self.K1 * np.exp(-self.K2 * dist**2)
+    return self.get_likelihoods(types.positions_to_xy([position]))[0]
+
+  def get_likelihoods(self, points: np.ndarray) -> np.ndarray:
+    """Returns the likelihood at each of the (M, 2) points, or 0 where the point is beyond the limit."""
+    return AggregatedBeliefState([self]).get_likelihoods(points)
+
+  def get_distances(self, points: np.ndarray) -> np.ndarray:
+    """Returns the distance from each of the (M, 2) points to the global plan or robot, where it is within the limit.
+
+    Elsewhere the result is some distance beyond the limit. Only plan segments near each point are measured.
+    """
+    points = np.asarray(points, dtype=float)[:, :2]
+    if len(self.global_plan) == 0:
+      # An empty plan is at distance 0 from every point, as in types.Path.distances_to
+      return np.zeros(len(points))
+    if self._segment_grid is None:
+      starts, ends = self.segments()
+      if len(points) * len(starts) <= _MAX_DIRECT_QUERY_PAIRS:
+        return types.min_segment_distances(points, starts, ends, [0])[:, 0]
+      self._segment_grid = types.SegmentGrid(starts, ends, self.limit)
+    return self._segment_grid.min_distances(points)
+
+  def segments(self) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the start and end points of the global plan's segments, followed by the robot as a point."""
+    robot_xy = types.positions_to_xy([self.robot.position])
+    if len(self.global_plan) == 0:
+      return robot_xy, robot_xy
+    starts, ends = self.global_plan.segments()
+    return np.concatenate([starts, robot_xy]), np.concatenate([ends, robot_xy])
 
 
 class AggregatedBeliefState:  # pylint: disable=too-few-public-methods
@@ -33,7 +61,31 @@ class AggregatedBeliefState:  # pylint: disable=too-few-public-methods
     self.belief_states = belief_states
 
   def get_likelihood(self, position: types.Position):
-    likelihoods = [belief_state.get_likelihood(position) for belief_state in self.belief_states]
-    if len(likelihoods) == 0:
-      return 0
-    return np.max(likelihoods)
+    return self.get_likelihoods(types.positions_to_xy([position]))[0]
+
+  def get_likelihoods(self, points: np.ndarray) -> np.ndarray:
+    """Returns the maximum likelihood over the belief states at each of the (M, 2) points."""
+    points = np.asarray(points, dtype=float)[:, :2]
+    if len(self.belief_states) == 0:
+      return np.zeros(len(points))
+    dist = np.stack([belief_state.get_distances(points) for belief_state in self.belief_states], axis=1)
+    limits = np.array([belief_state.limit for belief_state in self.belief_states])
+    likelihoods = np.where(dist > limits, 0.0, BeliefState.K1 * np.exp(-BeliefState.K2 * dist**2))
+    return np.max(likelihoods, axis=1)
+
+
+def calc_limit(time_since_last_update_ms: float) -> float:
+  """Returns how far a robot may have moved since its last update, at up to 2 m/s."""
+  return time_since_last_update_ms / 1000 * 2
+
+
+def calc_aggregated_belief_state(
+    robots: list[types.Robot],
+    global_plans: list[types.Path],
+    times_since_last_update: list[float],
+) -> AggregatedBeliefState:
+  """Returns the belief state of the robots from their last update, given in milliseconds ago."""
+  return AggregatedBeliefState([
+      BeliefState(robot, plan, calc_limit(time_ms))
+      for robot, plan, time_ms in zip(robots, global_plans, times_since_last_update)
+  ])
@@ -1,34 +1,332 @@
 # pylint: disable=no-member,only-importing-modules-is-allowed,too-few-public-methods,too-many-instance-attributes
+import dataclasses
+import hashlib
+import json
+import time
+from concurrent import futures
+
+import numpy as np
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
 
-from cvrp_experiments import belief_state, types
+from cvrp_experiments import belief_state, data as data_, instrumentation, solution_cache as solution_cache_, types
+
+# Part of every solution cache key, so that cached solutions are invalidated whenever the solver's code changes
+with open(__file__, "rb") as _f:
+  _SOURCE_HASH = hashlib.sha256(_f.read()).hexdigest()
+
+
+@dataclasses.dataclass
+class SearchOptions:
+  """OR-tools search configuration. Strategies are given by their enum names in routing_enums_pb2.
+
+  Metaheuristics other than greedy descent only stop at a limit, so they require `time_limit_s` or `solution_limit`.
+  """
+  first_solution_strategy: str = "PARALLEL_CHEAPEST_INSERTION"
+  local_search_metaheuristic: str = "GREEDY_DESCENT"
+  time_limit_s: float | None = None
+  solution_limit: int | None = None
+
+  def __post_init__(self) -> None:
+    unbounded = self.time_limit_s is None and self.solution_limit is None
+    if unbounded and self.local_search_metaheuristic not in ("GREEDY_DESCENT", "AUTOMATIC"):
+      raise ValueError(f"{self.local_search_metaheuristic} requires a time or solution limit")
+
+  def to_search_parameters(self):
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = getattr(
+        routing_enums_pb2.FirstSolutionStrategy, self.first_solution_strategy
+    )
+    search_parameters.local_search_metaheuristic = getattr(
+        routing_enums_pb2.LocalSearchMetaheuristic, self.local_search_metaheuristic
+    )
+    if self.time_limit_s is not None:
+      search_parameters.time_limit.FromMilliseconds(int(self.time_limit_s * 1000))
+    if self.solution_limit is not None:
+      search_parameters.solution_limit = self.solution_limit
+    return search_parameters
+
+
+DEFAULT_PORTFOLIO = (
+    SearchOptions("PARALLEL_CHEAPEST_INSERTION", "GREEDY_DESCENT"),
+    SearchOptions("PARALLEL_CHEAPEST_INSERTION", "GUIDED_LOCAL_SEARCH", solution_limit=1_000_000),
+    SearchOptions("PATH_CHEAPEST_ARC", "GUIDED_LOCAL_SEARCH", solution_limit=1_000_000),
+    SearchOptions("LOCAL_CHEAPEST_INSERTION", "TABU_SEARCH", solution_limit=1_000_000),
+    SearchOptions("SAVINGS", "SIMULATED_ANNEALING", solution_limit=1_000_000),
+)
+
+
+@dataclasses.dataclass
+class PortfolioResult:
+  route: list[int]
+  search_options: SearchOptions
+  objective: int
+  distance: int
+  reward: int
+  penalty: int
+  reward_evolution: list[int]
+  incumbent_trace: list[tuple[float, int]]
+
+
+def solve_portfolio(
+    data: dict,
+    time_limit_s: float,
+    portfolio: tuple[SearchOptions, ...] = DEFAULT_PORTFOLIO,
+    initial_route: list[int] | None = None,
+    executor: futures.Executor | None = None,
+) -> PortfolioResult | None:
+  """Races the same instance under several search configurations and returns the result with the best objective.
+
+  All configurations share one wall-clock deadline, `time_limit_s` from now, which also caps any time limit of their
+  own. A process pool is created for the race unless an `executor` is given. Returns None if no configuration found a
+  solution before the deadline. Configurations that raise are reported, and if all of them do, the first error is
+  raised.
+  """
+  deadline = time.time() + time_limit_s
+  own_executor = executor is None
+  if executor is None:
+    executor = futures.ProcessPoolExecutor(max_workers=len(portfolio))
+  try:
+    futures_ = [
+        executor.submit(_solve_with_options, data, search_options, deadline, initial_route)
+        for search_options in portfolio
+    ]
+    # Leave some slack past the deadline for building the model and extracting the solution
+    done, _ = futures.wait(futures_, timeout=max(0, deadline - time.time()) + 1)
+  finally:
+    if own_executor:
+      executor.shutdown(wait=False, cancel_futures=True)
+  results, errors = [], []
+  for search_options, future in zip(portfolio, futures_):
+    if future not in done:
+      continue
+    if future.exception() is not None:
+      print(f"Portfolio entry {search_options} failed: {future.exception()!r}")
+      errors.append(future.exception())
+    elif future.result() is not None:
+      results.append(future.result())
+  if errors and len(errors) == len(portfolio):
+    raise RuntimeError("Every portfolio entry failed") from errors[0]
+  if not results:
+    return None
+  return min(results, key=lambda result: result.objective)
+
+
+def _solve_with_options(
+    data: dict,
+    search_options: SearchOptions,
+    deadline: float,
+    initial_route: list[int] | None,
+) -> PortfolioResult | None:
+  time_limit_s = max(0.001, deadline - time.time())
+  if search_options.time_limit_s is not None:
+    time_limit_s = min(time_limit_s, search_options.time_limit_s)
+  # The result reports the portfolio entry as given, not with the time limit clipped to the deadline
+  vrp_solver = VrpSolver(data, True, search_options=dataclasses.replace(search_options, time_limit_s=time_limit_s))
+  route = vrp_solver.solve(initial_route)
+  if vrp_solver.objective is None:
+    return None
+  return PortfolioResult(
+      route,
+      search_options,
+      vrp_solver.objective,
+      vrp_solver.distance,
+      vrp_solver.reward,
+      vrp_solver.penalty,
+      vrp_solver.reward_evolution,
+      vrp_solver.incumbent_trace,
+  )
 
 
 class VrpSolver:
+  MAX_TRAVEL_DISTANCE = 1000
 
-  def __init__(self, data: dict, silent_mode: bool = False, use_baseline_vrp_solution: bool = False) -> None:
+  def __init__(
+      self,
+      data: dict,
+      silent_mode: bool = False,
+      use_baseline_vrp_solution: bool = False,
+      search_options: SearchOptions | None = None,
+      solution_cache: solution_cache_.SolutionCache | None = None,
+      timer: instrumentation.PhaseTimer | None = None,
+      joint: bool = False,
+  ) -> None:
+    """With `joint`, every robot in the snapshot is planned for in one multi-vehicle model over the shared cells,
+    instead of only the first robot. Cell rewards still come from the other robots' belief states, so objectives
+    stay comparable with the single robot solve. Robots need connections to the cells in the snapshot.
+    """
+    if joint and use_baseline_vrp_solution:
+      raise ValueError("The baseline solution can only be used for a single robot")
     self._silent_mode = silent_mode
+    self._search_options = search_options or SearchOptions()
+    self._solution_cache = solution_cache
+    self._timer = timer or instrumentation.PhaseTimer(enabled=False)
     self._use_baseline_vrp_solution = use_baseline_vrp_solution
+    self._joint = joint
+    self._load_snapshot(data)
+
+  def _load_snapshot(
+      self,
+      data: dict,
+      previous_connections: types.Connections | None = None,
+      previous_belief_states: dict[int, belief_state.BeliefState] | None = None,
+  ) -> None:
     self._current_robot = types.Robot.from_dict(data["robots"][0])
     self._other_robots = [types.Robot.from_dict(i) for i in data["robots"][1:]]
     self._other_robot_global_paths = [types.Path.from_dict(i) for i in data["other_robot_global_paths"]]
-    self._baseline_vrp_solution = []
-    if use_baseline_vrp_solution and len(data["vrp_solution"]) > 0:
-      self._baseline_vrp_solution = data["vrp_solution"][0]["route"]
+    # Robots planned for, in vehicle order. Vehicle i starts at vrp index i + 1 and all vehicles end at vrp index 0
+    self._robots = [self._current_robot] + (self._other_robots if self._joint else [])
+    self.logged_vrp_solution: list[int] = []
+    if len(data.get("vrp_solution", [])) > 0:
+      self.logged_vrp_solution = data["vrp_solution"][0]["route"]
+    self._baseline_vrp_solution = self.logged_vrp_solution if self._use_baseline_vrp_solution else []
     self._times_since_last_update = data["time_since_last_update"]
-    self._connections = types.Connections.from_dict(data)
-    self._cell_ids = self._get_connected_cell_ids(data)
-    self._cells = self._get_connected_cells(data)
-    self._aggregated_belief_state = self._calc_aggregated_belief_state()
-    self._num_vehicles = 1
-    self._depot_indices = [1]
-    self._end_indicies = [0]
+    with self._timer.phase("connection_indexing"):
+      self._connections = types.Connections.from_dict(data, previous_connections)
+      self._cell_ids = self._get_connected_cell_ids(data)
+      self._cells = self._get_connected_cells(data)
+    self._aggregated_belief_state = self._calc_aggregated_belief_state(previous_belief_states or {})
+    self._num_vehicles = len(self._robots)
+    self._depot_indices = list(range(1, self._num_vehicles + 1))
+    self._end_indicies = [0] * self._num_vehicles
     self._distance_matrix_size = len(self._cell_ids) + self._num_vehicles + 1
     self.distance, self.reward, self.penalty, self.reward_evolution = 0, 0, 0, []
+    # (seconds since the search started, objective) for each improving solution found by the last solve
+    self.incumbent_trace: list[tuple[float, int]] = []
+    # Routing objective of the last solution found by solve, None if there is none
+    self.objective: int | None = None
+    # Whether the last solve searched from its initial routes, i.e. they were given and feasible
+    self.warm_started = False
+    self._distance_matrix: np.ndarray | None = None
+    # Likelihood of each cell under each other robot's belief state, in the order of self._cells and belief states
+    self._cell_likelihoods: np.ndarray | None = None
+    self._node_costs: list[float] | None = None
+    self._node_rewards: list[int] | None = None
 
-  def solve(self) -> list[int]:
-    distance_matrix = self._calc_distance_matrix()
-    node_rewards = self._calc_node_rewards()
+  @staticmethod
+  def from_log(path_to_logs: str, idx: int, use_cache: bool = True, **kwargs) -> "VrpSolver":
+    """Creates a solver for the snapshot at `idx` of a log, loading it from the log's snapshot cache by default."""
+    timer = kwargs.get("timer") or instrumentation.PhaseTimer(enabled=False)
+    with timer.phase("parse"):
+      raw_data = data_.load_snapshot(path_to_logs, idx, use_cache)
+    return VrpSolver(raw_data, **kwargs)
+
+  def invalidate_cache(self) -> None:
+    """Drops the derived distance matrix, node costs and rewards so they are recomputed on next use.
+
+    Must be called after changing any of the solver's inputs (cells, connections, robots or belief states).
+    """
+    self._distance_matrix = None
+    self._cell_likelihoods = None
+    self._node_costs = None
+    self._node_rewards = None
+
+  def update(self, data: dict) -> None:
+    """Moves the solver on to the next snapshot, recomputing only what changed since the current one.
+
+    Connections identical to the current ones are not parsed again. Distance matrix entries are kept for nodes in
+    both snapshots, and only pairs whose connection appeared, disappeared or changed are rewritten. Belief states of
+    other robots with the same position, plan and limit are kept along with their likelihoods at cells that did not
+    move, while the others are updated in place and evaluated again. The result is the same as constructing a new
+    solver from `data` with the same options.
+    """
+    previous_node_keys = self._get_node_keys()
+    previous_connections = self._connections
+    previous_distance_matrix = self._distance_matrix
+    previous_cell_rows = {cell_id: i for i, cell_id in enumerate(self._cell_ids)}
+    previous_cell_positions = types.positions_to_xy([cell.position for cell in self._cells])
+    previous_cell_likelihoods = self._cell_likelihoods
+    previous_belief_states = {
+        belief_state_.robot.robot_id: belief_state_ for belief_state_ in self._aggregated_belief_state.belief_states
+    }
+    # Belief states are updated in place, so their inputs are captured first, with their column of likelihoods
+    previous_belief_inputs = {
+        belief_state_.robot.robot_id: (i, belief_state_.robot.position, belief_state_.global_plan, belief_state_.limit)
+        for i, belief_state_ in enumerate(self._aggregated_belief_state.belief_states)
+    }
+    self._load_snapshot(data, previous_connections, previous_belief_states)
+    if previous_distance_matrix is not None:
+      with self._timer.phase("distance_matrix"):
+        self._distance_matrix = self._update_distance_matrix(
+            previous_node_keys, previous_distance_matrix, previous_connections
+        )
+    if previous_cell_likelihoods is not None:
+      with self._timer.phase("rewards"):
+        self._cell_likelihoods = self._update_cell_likelihoods(
+            previous_cell_rows, previous_cell_positions, previous_cell_likelihoods, previous_belief_inputs
+        )
+
+  def solve(self, initial_route: list[int] | None = None) -> list[int]:
+    """Solves the VRP and returns the route as node ids, starting with the current robot's id.
+
+    If `initial_route` is given, the search is warm-started from it. It has the same format as the returned route,
+    e.g. the previous timestep's solution or `logged_vrp_solution`. Cells that are no longer connected are dropped,
+    and the route is cut short where it would exceed the maximum travel distance.
+
+    With a solution cache, an instance already solved with the same parameters is read back instead of solved.
+    """
+    routes = self.solve_routes([initial_route] if initial_route else None)
+    return routes[0] if routes else []
+
+  def solve_routes(self, initial_routes: list[list[int]] | None = None) -> list[list[int]]:
+    """Like solve, but returns one route per planned robot, in the order of the snapshot's robots.
+
+    `initial_routes` warm-starts the search with one route per robot; missing trailing routes are left empty. The
+    distance, reward and penalty are totals over all routes. Returns an empty list if no solution was found.
+    """
+    if self._solution_cache is None:
+      return self._solve(initial_routes)
+    key = self._calc_solution_cache_key(initial_routes)
+    entry = self._solution_cache.get(key)
+    if entry is not None:
+      self.warm_started = False
+      self.distance, self.reward, self.penalty = entry["distance"], entry["reward"], entry["penalty"]
+      self.reward_evolution, self.objective = entry["reward_evolution"], entry["objective"]
+      self.incumbent_trace = [(elapsed, objective) for elapsed, objective in entry["incumbent_trace"]]
+      return entry["routes"]
+    routes = self._solve(initial_routes)
+    if routes:
+      self._solution_cache.put(key, {
+          "routes": routes,
+          "distance": self.distance,
+          "reward": self.reward,
+          "penalty": self.penalty,
+          "reward_evolution": self.reward_evolution,
+          "objective": self.objective,
+          "incumbent_trace": self.incumbent_trace,
+      })
+    return routes
+
+  def _solve(self, initial_routes: list[list[int]] | None) -> list[list[int]]:
+    distance_matrix = self._get_distance_matrix().tolist()
+    node_rewards = self._get_node_rewards()
+    with self._timer.phase("model_build"):
+      manager, routing = self._build_model(distance_matrix, node_rewards)
+      search_parameters = self._search_options.to_search_parameters()
+
+    if self._use_baseline_vrp_solution:
+      with self._timer.phase("extraction"):
+        return [self._extract_baseline_solution(manager, routing)]
+
+    with self._timer.phase("search"):
+      self._record_incumbents(routing)
+      initial_assignment = None
+      if initial_routes:
+        initial_assignment = self._read_initial_assignment(manager, routing, search_parameters, initial_routes)
+      self.warm_started = bool(initial_assignment)
+      if initial_assignment:
+        solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+      else:
+        solution = routing.SolveWithParameters(search_parameters)
+    if solution:
+      with self._timer.phase("extraction"):
+        vrp_solutions = self._extract_solution(manager, routing, solution)
+        if not self._silent_mode:
+          self._print_solution(manager, routing, vrp_solutions)
+        return [self._vrp_ids_to_node_ids(vrp_solution) for vrp_solution in vrp_solutions]
+    print("No solution found.")
+    return []
+
+  def _build_model(self, distance_matrix: list[list[int]], node_rewards: list[int]):
     # node_costs = self._calc_node_costs()
     manager = pywrapcp.RoutingIndexManager(
         self._distance_matrix_size,
@@ -61,7 +359,7 @@ class VrpSolver:
     routing.AddDimension(
         distance_callback_index,
         0,  # no slack
-        1000,  # vehicle maximum travel distance
+        self.MAX_TRAVEL_DISTANCE,  # vehicle maximum travel distance
         True,  # start cumul to zero
         "distance",
     )
@@ -85,81 +383,151 @@ class VrpSolver:
     # Add disjunction, allows nodes to be skipped
     for node in range(self._num_vehicles + 1, self._distance_matrix_size):
       routing.AddDisjunction([manager.NodeToIndex(node)], 1000)
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PARALLEL_CHEAPEST_INSERTION
-    search_parameters.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT
+    return manager, routing
 
-    if self._use_baseline_vrp_solution:
-      return self._extract_baseline_solution(manager, routing)
+  def solve_with_path(self, initial_route: list[int] | None = None) -> types.Path:
+    return self.route_to_path(self.solve(initial_route))
 
-    solution = routing.SolveWithParameters(search_parameters)
-    if solution:
-      vrp_solution = self._extract_solution(manager, routing, solution)
-      if not self._silent_mode:
-        self._print_solution(manager, routing, vrp_solution)
-      return self._vrp_ids_to_node_ids(vrp_solution)
-    print("No solution found.")
-    return []
+  def route_to_path(self, vrp_solution: list[int]) -> types.Path:
+    """Joins the connection paths along a route returned by solve."""
+    with self._timer.phase("path_assembly"):
+      paths_between_nodes = []
+      for i in range(len(vrp_solution) - 1):
+        from_node_id = vrp_solution[i]
+        to_node_id = vrp_solution[i + 1]
+        from_node_is_robot = i == 0
+        paths_between_nodes.append(
+            self._connections.get_path_between_nodes(from_node_id, from_node_is_robot, to_node_id, False)
+        )
+      return types.Path.concatenate(paths_between_nodes)
+
+  def _calc_solution_cache_key(self, initial_routes: list[list[int]] | None) -> str:
+    parameters = {
+        "search_options": dataclasses.asdict(self._search_options),
+        "initial_routes": initial_routes,
+        "use_baseline_vrp_solution": self._use_baseline_vrp_solution,
+        "baseline_vrp_solution": self._baseline_vrp_solution,
+        "robot_ids": [robot.robot_id for robot in self._robots],
+        "cell_ids": self._cell_ids,
+    }
+    return solution_cache_.hash_key(
+        _SOURCE_HASH,
+        self._get_distance_matrix().tobytes(),
+        json.dumps(self._get_node_rewards()),
+        json.dumps(parameters, sort_keys=True),
+    )
+
+  def _record_incumbents(self, routing) -> None:
+    self.incumbent_trace = []
+    start_time = time.monotonic()
+
+    def on_solution():
+      objective = routing.CostVar().Value()
+      if not self.incumbent_trace or objective < self.incumbent_trace[-1][1]:
+        self.incumbent_trace.append((time.monotonic() - start_time, objective))
+
+    routing.AddAtSolutionCallback(on_solution)
 
-  def solve_with_path(self) -> types.Path:
-    vrp_solution = self.solve()
-    path = types.Path([])
-    for i in range(len(vrp_solution) - 1):
-      from_node_id = vrp_solution[i]
-      to_node_id = vrp_solution[i + 1]
-      from_node_is_robot = i == 0
-      path_between_nodes = self._connections.get_path_between_nodes(from_node_id, from_node_is_robot, to_node_id, False)
-      path.extend(path_between_nodes)
-    return path
-
-  def _extract_solution(self, manager, routing, solution) -> list[int]:
+  def _read_initial_assignment(self, manager, routing, search_parameters, initial_routes: list[list[int]]):
+    initial_routes = list(initial_routes[:self._num_vehicles])
+    initial_routes += [[]] * (self._num_vehicles - len(initial_routes))
+    vrp_routes: list[list[int]] = []
+    visited: set[int] = set()
+    for vehicle, route in enumerate(initial_routes):
+      vrp_routes.append(self._node_ids_to_vrp_ids(route, vehicle, visited))
+      visited.update(vrp_routes[-1])
+    if not visited:
+      return None
+    routing.CloseModelWithParameters(search_parameters)
+    initial_assignment = routing.ReadAssignmentFromRoutes(
+        [[manager.NodeToIndex(i) for i in vrp_indices] for vrp_indices in vrp_routes], True
+    )
+    if not initial_assignment and not self._silent_mode:
+      print("Initial route is infeasible, solving from scratch.")
+    return initial_assignment
+
+  def _node_ids_to_vrp_ids(self, route: list[int], vehicle: int = 0, visited: set[int] | None = None) -> list[int]:
+    """Maps a route's cells onto the current vrp indices, leaving out the start node.
+
+    Cells that would make the route infeasible are skipped: cells no longer connected, repeated cells or cells in
+    `visited` by another vehicle, and cells reached by an arc with a negative "distance_and_reward" transit, which
+    the routing model does not accept. The route is cut at the maximum travel distance.
+    """
+    distance_matrix = self._get_distance_matrix()
+    node_rewards = self._get_node_rewards()
+    visited = visited or set()
+    cell_indices = {cell_id: i + self._num_vehicles + 1 for i, cell_id in enumerate(self._cell_ids)}
+    vrp_indices: list[int] = []
+    previous_idx, distance = self._depot_indices[vehicle], 0
+    for node_id in route[1:]:
+      idx = cell_indices.get(node_id)
+      if idx is None or idx in vrp_indices or idx in visited:
+        continue
+      transit = int(distance_matrix[previous_idx, idx])
+      if transit - node_rewards[idx] // 10 < 0:
+        continue
+      if distance + transit > self.MAX_TRAVEL_DISTANCE:
+        break
+      vrp_indices.append(idx)
+      previous_idx, distance = idx, distance + transit
+    return vrp_indices
+
+  def _extract_solution(self, manager, routing, solution) -> list[list[int]]:
     self.distance, self.reward, self.penalty, self.reward_evolution = 0, 0, 0, []
-    node_rewards = self._calc_node_rewards()
+    self.objective = solution.ObjectiveValue()
+    node_rewards = self._get_node_rewards()
     self.penalty = sum(node_rewards)
-    vrp_solution = []
-    index = routing.Start(0)
+    vrp_solutions = []
     distance_dimension = routing.GetDimensionOrDie("distance")
-    while not routing.IsEnd(index):
-      node_index = manager.IndexToNode(index)
-      vrp_solution.append(node_index)
-      previous_index = index
-      index = solution.Value(routing.NextVar(index))
-      distance_from_previous = distance_dimension.GetTransitValue(previous_index, index, 0)
-      self.distance += distance_from_previous
-      if node_index <= self._num_vehicles:
-        continue
-      reward = node_rewards[node_index]
-      self.reward += reward
-      self.reward_evolution.append(reward)
+    for vehicle in range(self._num_vehicles):
+      vrp_solution = []
+      index = routing.Start(vehicle)
+      while not routing.IsEnd(index):
+        node_index = manager.IndexToNode(index)
+        vrp_solution.append(node_index)
+        previous_index = index
+        index = solution.Value(routing.NextVar(index))
+        distance_from_previous = distance_dimension.GetTransitValue(previous_index, index, vehicle)
+        self.distance += distance_from_previous
+        if node_index <= self._num_vehicles:
+          continue
+        reward = node_rewards[node_index]
+        self.reward += reward
+        self.reward_evolution.append(reward)
+      vrp_solutions.append(vrp_solution)
     self.penalty -= self.reward
-    return vrp_solution
+    return vrp_solutions
 
   def _vrp_ids_to_node_ids(self, vrp_indices: list[int]) -> list[int]:
     vrp_solution = []
     for node_idx in vrp_indices:
-      if node_idx == 1:
-        vrp_solution.append(self._current_robot.robot_id)
-      elif node_idx > 1:
+      if 0 < node_idx <= self._num_vehicles:
+        vrp_solution.append(self._robots[node_idx - 1].robot_id)
+      elif node_idx > self._num_vehicles:
         vrp_solution.append(self._cell_ids[node_idx - self._num_vehicles - 1])
     return vrp_solution
 
-  def _print_solution(self, manager, routing, vrp_indices: list[int]) -> None:  # pylint: disable=too-many-locals
+  def _print_solution(  # pylint: disable=too-many-locals
+      self, manager, routing, vrp_solutions: list[list[int]]
+  ) -> None:
     plan_output = ""
     distance_dimension = routing.GetDimensionOrDie("distance")
-    for prev_node_idx, node_idx in zip(vrp_indices[:-1], vrp_indices[1:]):
-      previous_index = manager.NodeToIndex(prev_node_idx)
-      index = manager.NodeToIndex(node_idx)
-      distance_from_previous = distance_dimension.GetTransitValue(previous_index, index, 0)
-      plan_output += f"{prev_node_idx} ->({distance_from_previous}) "
-    plan_output += f"{vrp_indices[-1]}\n"
+    for vrp_indices in vrp_solutions:
+      for prev_node_idx, node_idx in zip(vrp_indices[:-1], vrp_indices[1:]):
+        previous_index = manager.NodeToIndex(prev_node_idx)
+        index = manager.NodeToIndex(node_idx)
+        distance_from_previous = distance_dimension.GetTransitValue(previous_index, index, 0)
+        plan_output += f"{prev_node_idx} ->({distance_from_previous}) "
+      plan_output += f"{vrp_indices[-1]}\n"
     plan_output += f"Distance of the route: {self.distance}m\n"
     plan_output += f"Reward of the route: {self.reward}\n"
     plan_output += f"Penalty of the route: {self.penalty}\n"
     print(plan_output)
-    print(self._vrp_ids_to_node_ids(vrp_indices))
+    for vrp_indices in vrp_solutions:
+      print(self._vrp_ids_to_node_ids(vrp_indices))
 
   def _extract_baseline_solution(self, manager, routing) -> list[int]:
-    node_rewards = self._calc_node_rewards()
+    node_rewards = self._get_node_rewards()
     self.distance, self.reward, self.penalty, self.reward_evolution = 0, 0, 0, []
     self.penalty = sum(node_rewards)
     vrp_solution = []
@@ -184,10 +552,97 @@ class VrpSolver:
       self.distance += distance_dimension.GetTransitValue(previous_index, index, 0)
       self.reward_evolution.append(node_rewards[idx])
     if not self._silent_mode:
-      self._print_solution(manager, routing, vrp_solution)
+      self._print_solution(manager, routing, [vrp_solution])
     return self._vrp_ids_to_node_ids(vrp_solution)
 
-  def _calc_distance_matrix(self) -> list[list[int]]:
+  def _get_distance_matrix(self) -> np.ndarray:
+    if self._distance_matrix is None:
+      with self._timer.phase("distance_matrix"):
+        self._distance_matrix = self._calc_distance_matrix()
+    return self._distance_matrix
+
+  def _get_cell_likelihoods(self) -> np.ndarray:
+    if self._cell_likelihoods is None:
+      self._cell_likelihoods = self._calc_cell_likelihoods()
+    return self._cell_likelihoods
+
+  def _get_node_costs(self) -> list[float]:
+    if self._node_costs is None:
+      self._node_costs = self._calc_node_costs()
+    return self._node_costs
+
+  def _get_node_rewards(self) -> list[int]:
+    if self._node_rewards is None:
+      with self._timer.phase("rewards"):
+        self._node_rewards = self._calc_node_rewards()
+    return self._node_rewards
+
+  def _calc_distance_matrix(self) -> np.ndarray:
+    node_indices = {key: i for i, key in enumerate(self._get_node_keys())}
+    rows, cols, distances = [], [], []
+    for connection in self._connections.unique_connections():
+      from_index = node_indices.get((connection.from_node_id, connection.is_from_node_robot))
+      to_index = node_indices.get((connection.to_node_id, connection.is_to_node_robot))
+      if from_index is None or to_index is None or from_index == to_index:
+        continue
+      rows.append(max(from_index, to_index))
+      cols.append(min(from_index, to_index))
+      distances.append(connection.distance)
+    distance_matrix = self._calc_unconnected_distance_matrix()
+    distance_matrix[rows, cols] = distances
+    distance_matrix[cols, rows] = distances
+    return distance_matrix
+
+  def _calc_unconnected_distance_matrix(self) -> np.ndarray:
+    """Returns the distance matrix of nodes without connections.
+
+    Cells are 9999 away from robots and other cells, the same distance as Connections.get_connection_distance gives
+    for a missing connection. The end node and robots are 0 away from each other.
+    """
+    first_cell_index = self._num_vehicles + 1
+    distance_matrix = np.zeros((self._distance_matrix_size, self._distance_matrix_size), dtype=np.int64)
+    distance_matrix[first_cell_index:, 1:] = 9999
+    distance_matrix[1:, first_cell_index:] = 9999
+    np.fill_diagonal(distance_matrix, 0)
+    return distance_matrix
+
+  def _update_distance_matrix(
+      self,
+      previous_node_keys: list[types.NodeKey | None],
+      previous_distance_matrix: np.ndarray,
+      previous_connections: types.Connections,
+  ) -> np.ndarray:
+    node_keys = self._get_node_keys()
+    node_indices = {key: i for i, key in enumerate(node_keys)}
+    previous_node_indices = {key: i for i, key in enumerate(previous_node_keys)}
+    # The end node is always kept, so there is at least one node in both snapshots
+    kept = np.array([(i, previous_node_indices[key])
+                     for i, key in enumerate(node_keys)
+                     if key in previous_node_indices])
+    distance_matrix = self._calc_unconnected_distance_matrix()
+    distance_matrix[np.ix_(kept[:, 0], kept[:, 0])] = previous_distance_matrix[np.ix_(kept[:, 1], kept[:, 1])]
+    changed = self._connections.changed_distances(previous_connections)
+    for key in node_keys:
+      if key not in previous_node_indices:
+        changed.update(self._connections.node_distances(key))
+    for nodes, distance in changed.items():
+      indices = [node_indices.get(key) for key in nodes]
+      if len(indices) != 2 or None in indices:
+        continue
+      i, j = indices
+      if distance is None:
+        # The connection was removed, so the pair falls back to the distance of unconnected nodes
+        distance = 9999 if max(i, j) > self._num_vehicles and min(i, j) > 0 else 0
+      distance_matrix[i, j] = distance_matrix[j, i] = distance
+    return distance_matrix
+
+  def _get_node_keys(self) -> list[types.NodeKey | None]:
+    """Returns the node of each vrp index, None for the end node."""
+    robot_keys = [(robot.robot_id, True) for robot in self._robots]
+    return [None] + robot_keys + [(cell_id, False) for cell_id in self._cell_ids]
+
+  def _calc_distance_matrix_reference(self) -> list[list[int]]:
+    """List-based equivalent of _calc_distance_matrix for a single robot, kept for checking its output."""
     distance_matrix = [[0 for _ in range(self._distance_matrix_size)] for _ in range(self._distance_matrix_size)]
     for i, cell_id in enumerate(self._cell_ids):
       # Second column is from robot to cells
@@ -227,14 +682,49 @@ class VrpSolver:
 
   def _calc_node_costs(self) -> list[float]:
     node_costs = [0 for _ in range(self._num_vehicles + 1)]
-    for cell in self._cells:
-      likelihood = self._aggregated_belief_state.get_likelihood(cell.position)
-      likelihood = min(1, likelihood / 0.1)
-      node_costs.append(likelihood)
+    cell_likelihoods = self._get_cell_likelihoods()
+    # The most likely robot at each cell decides its cost, as in AggregatedBeliefState
+    likelihoods = cell_likelihoods.max(axis=1) if cell_likelihoods.shape[1] > 0 else np.zeros(len(cell_likelihoods))
+    node_costs.extend(np.minimum(1, likelihoods / 0.1).tolist())
     return node_costs
 
+  def _calc_cell_likelihoods(self) -> np.ndarray:
+    cell_positions = types.positions_to_xy([cell.position for cell in self._cells])
+    belief_states = self._aggregated_belief_state.belief_states
+    cell_likelihoods = np.zeros((len(self._cells), len(belief_states)))
+    for i, belief_state_ in enumerate(belief_states):
+      cell_likelihoods[:, i] = belief_state_.get_likelihoods(cell_positions)
+    return cell_likelihoods
+
+  def _update_cell_likelihoods(
+      self,
+      previous_cell_rows: dict[int, int],
+      previous_cell_positions: np.ndarray,
+      previous_cell_likelihoods: np.ndarray,
+      previous_belief_inputs: dict[int, tuple[int, types.Position, types.Path, float]],
+  ) -> np.ndarray:
+    cell_positions = types.positions_to_xy([cell.position for cell in self._cells])
+    kept_rows, previous_rows = [], []
+    for i, cell_id in enumerate(self._cell_ids):
+      j = previous_cell_rows.get(cell_id)
+      if j is not None and np.array_equal(cell_positions[i], previous_cell_positions[j]):
+        kept_rows.append(i)
+        previous_rows.append(j)
+    stale_rows = np.setdiff1d(np.arange(len(self._cells)), kept_rows)
+    belief_states = self._aggregated_belief_state.belief_states
+    cell_likelihoods = np.zeros((len(self._cells), len(belief_states)))
+    for i, belief_state_ in enumerate(belief_states):
+      previous_inputs = previous_belief_inputs.get(belief_state_.robot.robot_id)
+      if previous_inputs is None or not _belief_state_matches(belief_state_, *previous_inputs[1:]):
+        cell_likelihoods[:, i] = belief_state_.get_likelihoods(cell_positions)
+        continue
+      cell_likelihoods[kept_rows, i] = previous_cell_likelihoods[previous_rows, previous_inputs[0]]
+      if len(stale_rows) > 0:
+        cell_likelihoods[stale_rows, i] = belief_state_.get_likelihoods(cell_positions[stale_rows])
+    return cell_likelihoods
+
   def _calc_node_rewards(self) -> list[int]:
-    node_costs = self._calc_node_costs()
+    node_costs = self._get_node_costs()
     node_rewards = [int(1000 * (1 - likelihood)) for likelihood in node_costs]
     for i in range(self._num_vehicles + 1):
       node_rewards[i] = 0
@@ -248,14 +738,34 @@ class VrpSolver:
     return connected_cell_ids
 
   def _get_connected_cells(self, data: dict) -> list[types.Cell]:
-    all_cells = [types.Cell.from_dict(i) for i in data["cells"]]
-    connected_cells = []
-    for cell_id in self._cell_ids:
-      connected_cells.append(next(c for c in all_cells if c.cell_id == cell_id))
-    return connected_cells
+    cells_by_id = {cell.cell_id: cell for cell in (types.Cell.from_dict(i) for i in data["cells"])}
+    return [cells_by_id[cell_id] for cell_id in self._cell_ids]
 
-  def _calc_aggregated_belief_state(self) -> belief_state.AggregatedBeliefState:
+  def _calc_aggregated_belief_state(
+      self,
+      previous_belief_states: dict[int, belief_state.BeliefState],
+  ) -> belief_state.AggregatedBeliefState:
+    """Builds the other robots' belief states, reusing those of `previous_belief_states` by robot id."""
     belief_states = []
-    for robot, path, time in zip(self._other_robots, self._other_robot_global_paths, self._times_since_last_update):
-      belief_states.append(belief_state.BeliefState(robot, path, time / 1000 * 2))
+    for robot, path, time_ms in zip(self._other_robots, self._other_robot_global_paths, self._times_since_last_update):
+      limit = belief_state.calc_limit(time_ms)
+      belief_state_ = previous_belief_states.get(robot.robot_id)
+      if belief_state_ is None:
+        belief_state_ = belief_state.BeliefState(robot, path, limit)
+      elif _belief_state_matches(belief_state_, robot.position, path, limit):
+        belief_state_.robot = robot
+      else:
+        belief_state_.update(robot, path, limit)
+      belief_states.append(belief_state_)
     return belief_state.AggregatedBeliefState(belief_states)
+
+
+def _belief_state_matches(
+    belief_state_: belief_state.BeliefState,
+    position: types.Position,
+    global_plan: types.Path,
+    limit: float,
+) -> bool:
+  return belief_state_.robot.position == position and belief_state_.global_plan == global_plan and (
+      belief_state_.limit == limit
+  )
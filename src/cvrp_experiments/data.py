@@ -1,5 +1,75 @@
+import functools
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import time
+import zipfile
+from concurrent import futures
+from typing import Iterable, Iterator
+
+import numpy as np
 import yaml
 
+DOCUMENT_SEPARATOR = b"---\n"
+INDEX_SUFFIX = ".index.npz"
+CACHE_SUFFIX = ".cache"
+CACHE_VERSION = 1
+# Coarsest modification time resolution of common file systems (FAT). A log modified within this long before it was
+# checked may be modified again without its modification time changing.
+MTIME_GRANULARITY_NS = 2_000_000_000
+# Raised when reading a corrupt cache file, e.g. one truncated by a full disk
+_CACHE_ERRORS = (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile)
+
+# libyaml's loader is several times faster on large snapshots, but is only present if PyYAML was built against it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class LogFile:
+  """Randomly addressable view over the documents of a multi-document YAML log.
+
+  The log is memory-mapped and only a byte-offset index over the document separators is kept in memory, so
+  `logs[timestep]` reads a single document. Like `read_logs`, any text after the last separator is ignored.
+  """
+
+  def __init__(self, path_to_logs: str, persist_index: bool = False) -> None:
+    self.path = path_to_logs
+    self._file = open(path_to_logs, "rb")  # pylint: disable=consider-using-with
+    if os.fstat(self._file.fileno()).st_size > 0:
+      self._mmap: mmap.mmap | None = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+      self._mmap = None
+    self._bounds = load_log_index(path_to_logs, persist_index)
+
+  def __len__(self) -> int:
+    return len(self._bounds) - 1
+
+  def __getitem__(self, idx: int) -> str:
+    if idx < 0:
+      idx += len(self)
+    if not 0 <= idx < len(self):
+      raise IndexError(f"Log index {idx} out of range for {len(self)} documents")
+    assert self._mmap is not None
+    start, end = int(self._bounds[idx]), int(self._bounds[idx + 1]) - len(DOCUMENT_SEPARATOR)
+    return self._mmap[start:end].decode("utf-8")
+
+  def __iter__(self) -> Iterator[str]:
+    for idx in range(len(self)):
+      yield self[idx]
+
+  def __enter__(self) -> "LogFile":
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.close()
+
+  def close(self) -> None:
+    if self._mmap is not None:
+      self._mmap.close()
+      self._mmap = None
+    self._file.close()
+
 
 def read_logs(path_to_logs: str) -> list[str]:
   with open(path_to_logs, 'r', encoding="utf-8") as f:
@@ -7,5 +77,346 @@ def read_logs(path_to_logs: str) -> list[str]:
   return logs.split("---\n")[:-1]
 
 
+def iter_logs(path_to_logs: str) -> Iterator[str]:
+  """Yields the documents of a log one at a time without loading the whole file."""
+  with LogFile(path_to_logs) as logs:
+    yield from logs
+
+
+def load_log_index(path_to_logs: str, persist: bool = False) -> np.ndarray:
+  """Returns the byte offsets at which each document starts, followed by the end of the last document's separator.
+
+  A persisted index (see `derived_path`) is reused if the log's size and modification time still match it, and the log
+  was not modified shortly before the index was built. If it can't be written, the index is only kept in memory.
+  """
+  index_path = derived_path(path_to_logs, INDEX_SUFFIX)
+  stat = os.stat(path_to_logs)
+  try:
+    with np.load(index_path) as index:
+      if (int(index["size"]) == stat.st_size and int(index["mtime_ns"]) == stat.st_mtime_ns and
+          not _is_racy(stat.st_mtime_ns, int(index["checked_ns"]))):
+        return index["bounds"]
+  except _CACHE_ERRORS:
+    # A missing, corrupt or outdated index is rebuilt
+    pass
+  checked_ns = time.time_ns()
+  bounds = build_log_index(path_to_logs)
+  if persist:
+    tmp_path = index_path + ".tmp.npz"
+    try:
+      os.makedirs(os.path.dirname(index_path), exist_ok=True)
+      np.savez(tmp_path, bounds=bounds, size=stat.st_size, mtime_ns=stat.st_mtime_ns, checked_ns=checked_ns)
+      os.replace(tmp_path, index_path)
+    except OSError:
+      pass
+  return bounds
+
+
+def derived_path(path_to_logs: str, suffix: str) -> str:
+  """Returns where a file derived from the log, such as its index or snapshot cache, is kept.
+
+  That is next to the log, unless the log's directory is read-only. The file then goes to the user's cache
+  directory, under a name unique to the log's absolute path.
+  """
+  if os.access(os.path.dirname(os.path.abspath(path_to_logs)), os.W_OK):
+    return path_to_logs + suffix
+  cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+  digest = hashlib.sha256(os.path.abspath(path_to_logs).encode()).hexdigest()[:16]
+  return os.path.join(cache_home, "cvrp_experiments", f"{digest}_{os.path.basename(path_to_logs)}{suffix}")
+
+
+def build_log_index(path_to_logs: str) -> np.ndarray:
+  bounds = [0]
+  with open(path_to_logs, "rb") as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return np.array(bounds, dtype=np.int64)
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+      separator = buffer.find(DOCUMENT_SEPARATOR)
+      while separator != -1:
+        bounds.append(separator + len(DOCUMENT_SEPARATOR))
+        separator = buffer.find(DOCUMENT_SEPARATOR, bounds[-1])
+  return np.array(bounds, dtype=np.int64)
+
+
 def parse_log_line(log_line: str) -> dict:
-  return yaml.load(log_line, Loader=yaml.SafeLoader)
+  """Parses a log document. Truncated connections, logged as '...', are dropped."""
+  snapshot = yaml.load(log_line, Loader=YamlLoader)
+  if isinstance(snapshot, dict) and "connections" in snapshot:
+    snapshot["connections"] = [c for c in snapshot["connections"] if isinstance(c, dict)]
+  return snapshot
+
+
+def parse_logs(logs: Iterable[str], max_workers: int | None = None, chunksize: int = 4) -> list[dict]:
+  """Parses log documents across a process pool, returning them in the same order as `logs`."""
+  if max_workers == 1:
+    return [parse_log_line(log) for log in logs]
+  with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+    return list(executor.map(parse_log_line, logs, chunksize=chunksize))
+
+
+class SnapshotCache:
+  """Binary cache of the parsed snapshots of a log, stored as one `.npz` file per snapshot.
+
+  Robots, cells and connections are stored as arrays, with the positions of all paths of a kind flattened into
+  one (N, 3) array indexed by offsets. The remaining keys are stored as JSON. Decoded paths hold a `positions`
+  array instead of ROS `poses`, which `types.Path.from_dict` accepts.
+
+  The cache is rebuilt if the log's size or content hash no longer match it, or if it is corrupt. The hash is only
+  recomputed when the modification time changed, or when the log was modified within `MTIME_GRANULARITY_NS` of the
+  last check, so validating an up to date cache usually costs a single `stat`.
+  """
+
+  def __init__(self, path_to_logs: str, cache_dir: str | None = None, max_workers: int | None = None) -> None:
+    self.path = path_to_logs
+    self.cache_dir = cache_dir or derived_path(path_to_logs, CACHE_SUFFIX)
+    self._max_workers = max_workers
+    manifest = self._load_valid_manifest()
+    if manifest is None:
+      manifest = build_snapshot_cache(path_to_logs, self.cache_dir, max_workers)
+    self._num_snapshots = manifest["num_snapshots"]
+
+  def __len__(self) -> int:
+    return self._num_snapshots
+
+  def __getitem__(self, idx: int) -> dict:
+    if idx < 0:
+      idx += len(self)
+    if not 0 <= idx < len(self):
+      raise IndexError(f"Snapshot index {idx} out of range for {len(self)} snapshots")
+    try:
+      return self._load(idx)
+    except _CACHE_ERRORS as e:
+      print(f"Rebuilding the snapshot cache of {self.path}, as snapshot {idx} could not be read: {e}")
+      self.rebuild()
+      return self._load(idx)
+
+  def rebuild(self) -> None:
+    self._num_snapshots = build_snapshot_cache(self.path, self.cache_dir, self._max_workers)["num_snapshots"]
+
+  def _load(self, idx: int) -> dict:
+    with np.load(_snapshot_path(self.cache_dir, idx)) as arrays:
+      return decode_snapshot(dict(arrays))
+
+  def _load_valid_manifest(self) -> dict | None:
+    stat = os.stat(self.path)
+    try:
+      with open(os.path.join(self.cache_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+      if manifest.get("version") != CACHE_VERSION or manifest["size"] != stat.st_size:
+        return None
+      if manifest["mtime_ns"] == stat.st_mtime_ns and not _is_racy(stat.st_mtime_ns, manifest["checked_ns"]):
+        return manifest
+      checked_ns = time.time_ns()
+      if manifest["sha256"] != _hash_file(self.path):
+        return None
+    except FileNotFoundError:
+      return None
+    except (ValueError, KeyError, AttributeError):
+      # An unreadable manifest, e.g. one cut short by a full disk, is rebuilt like an outdated one
+      return None
+    manifest["mtime_ns"] = stat.st_mtime_ns
+    manifest["checked_ns"] = checked_ns
+    try:
+      _write_manifest(self.cache_dir, manifest)
+    except OSError:
+      # A read-only cache stays valid, the hash is just computed again next time
+      pass
+    return manifest
+
+
+def build_snapshot_cache(path_to_logs: str, cache_dir: str | None = None, max_workers: int | None = None) -> dict:
+  """Parses every snapshot of a log into a fresh cache directory and returns the cache's manifest.
+
+  An existing `cache_dir` is only replaced if it is empty or holds nothing but cache files, so that a mistyped
+  directory is never deleted.
+  """
+  cache_dir = cache_dir or derived_path(path_to_logs, CACHE_SUFFIX)
+  if os.path.isdir(cache_dir):
+    if not all(_is_cache_file(name) for name in os.listdir(cache_dir)):
+      raise FileExistsError(f"{cache_dir} holds files other than a snapshot cache, refusing to replace it")
+    shutil.rmtree(cache_dir)
+  os.makedirs(cache_dir)
+  stat = os.stat(path_to_logs)
+  checked_ns = time.time_ns()
+  # The log may have changed since this process, or the workers forked from it, last opened it
+  _open_log_file.cache_clear()
+  with LogFile(path_to_logs, persist_index=True) as logs:
+    num_snapshots = len(logs)
+  args = [(path_to_logs, cache_dir, idx) for idx in range(num_snapshots)]
+  if max_workers == 1:
+    for arg in args:
+      _cache_snapshot(arg)
+  else:
+    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+      list(executor.map(_cache_snapshot, args, chunksize=4))
+  # The manifest is written last, so an interrupted build is never mistaken for a valid cache
+  manifest = {
+      "version": CACHE_VERSION,
+      "size": stat.st_size,
+      "mtime_ns": stat.st_mtime_ns,
+      "checked_ns": checked_ns,
+      "sha256": _hash_file(path_to_logs),
+      "num_snapshots": num_snapshots,
+  }
+  _write_manifest(cache_dir, manifest)
+  return manifest
+
+
+def prepare_snapshots(path_to_logs: str, use_cache: bool = True) -> int:
+  """Builds the log's snapshot cache, or persists its index, and returns the number of snapshots.
+
+  Call this in the parent process before loading snapshots with `load_snapshot` from a process pool.
+  """
+  cache = _open_snapshot_cache(path_to_logs) if use_cache else None
+  if cache is not None:
+    return len(cache)
+  return len(_open_log_file(path_to_logs))
+
+
+def load_snapshot(path_to_logs: str, idx: int, use_cache: bool = True) -> dict:
+  """Returns the parsed snapshot at `idx`, from the log's snapshot cache if `use_cache` is set.
+
+  Without the cache, only the document at `idx` is read and parsed, which is faster for a single snapshot than
+  building the cache of the whole log. The cache is built on first use. When loading from several processes, build
+  it beforehand in the parent process with `prepare_snapshots`, so the workers don't race to build it.
+  """
+  cache = _open_snapshot_cache(path_to_logs) if use_cache else None
+  if cache is not None:
+    return cache[idx]
+  return parse_log_line(_open_log_file(path_to_logs)[idx])
+
+
+def encode_snapshot(snapshot: dict) -> dict[str, np.ndarray]:
+  """Converts a snapshot from `parse_log_line` into arrays."""
+  remainder = dict(snapshot)
+  robots = remainder.pop("robots", [])
+  cells = remainder.pop("cells", [])
+  connections = remainder.pop("connections", [])
+  arrays = {
+      "robot_ids": np.array([robot["id"] for robot in robots], dtype=np.int64),
+      "robot_positions": _positions_to_array([robot["position"] for robot in robots]),
+      "robot_state_estimations": _positions_to_array([robot["state_estimation"] for robot in robots]),
+      "cell_ids": np.array([cell["id"] for cell in cells], dtype=np.int64),
+      "cell_positions": _positions_to_array([cell["position"] for cell in cells]),
+      "cell_connection_points": _positions_to_array([cell["connection_point"] for cell in cells]),
+      "connection_node_ids": np.array([[c["from_node_id"], c["to_node_id"]] for c in connections],
+                                      dtype=np.int64).reshape(-1, 2),
+      "connection_is_robot": np.array([[c["is_from_node_robot"], c["is_to_node_robot"]] for c in connections],
+                                      dtype=bool).reshape(-1, 2),
+      "connection_distances": np.array([c["distance"] for c in connections]),
+  }
+  _encode_paths(arrays, "connection_path", [c["path"] for c in connections])
+  _encode_paths(arrays, "other_robot_global_path", remainder.pop("other_robot_global_paths", []))
+  if "global_path" in remainder:
+    _encode_paths(arrays, "global_path", [remainder.pop("global_path")])
+  arrays["json"] = np.array(json.dumps(remainder))
+  return arrays
+
+
+def decode_snapshot(arrays: dict[str, np.ndarray]) -> dict:
+  snapshot = json.loads(str(arrays["json"]))
+  snapshot["robots"] = [{
+      "id": robot_id,
+      "position": _position_to_dict(position),
+      "state_estimation": _position_to_dict(state_estimation),
+  } for robot_id, position, state_estimation in zip(
+      arrays["robot_ids"].tolist(),
+      arrays["robot_positions"].tolist(),
+      arrays["robot_state_estimations"].tolist(),
+  )]
+  snapshot["cells"] = [{
+      "id": cell_id,
+      "position": _position_to_dict(position),
+      "connection_point": _position_to_dict(connection_point),
+  } for cell_id, position, connection_point in zip(
+      arrays["cell_ids"].tolist(),
+      arrays["cell_positions"].tolist(),
+      arrays["cell_connection_points"].tolist(),
+  )]
+  snapshot["connections"] = [{
+      "from_node_id": from_node_id,
+      "is_from_node_robot": is_from_node_robot,
+      "to_node_id": to_node_id,
+      "is_to_node_robot": is_to_node_robot,
+      "distance": distance,
+      "path": path,
+  } for (from_node_id, to_node_id), (is_from_node_robot, is_to_node_robot), distance, path in zip(
+      arrays["connection_node_ids"].tolist(),
+      arrays["connection_is_robot"].tolist(),
+      arrays["connection_distances"].tolist(),
+      _decode_paths(arrays, "connection_path"),
+  )]
+  snapshot["other_robot_global_paths"] = _decode_paths(arrays, "other_robot_global_path")
+  if "global_path_offsets" in arrays:
+    snapshot["global_path"] = _decode_paths(arrays, "global_path")[0]
+  return snapshot
+
+
+def _encode_paths(arrays: dict[str, np.ndarray], prefix: str, paths: list[dict]) -> None:
+  positions = [[pose["pose"]["position"] for pose in path["poses"]] for path in paths]
+  arrays[f"{prefix}_offsets"] = np.cumsum([0] + [len(p) for p in positions], dtype=np.int64)
+  arrays[f"{prefix}_positions"] = _positions_to_array([position for p in positions for position in p])
+
+
+def _decode_paths(arrays: dict[str, np.ndarray], prefix: str) -> list[dict]:
+  offsets = arrays[f"{prefix}_offsets"].tolist()
+  positions = arrays[f"{prefix}_positions"]
+  return [{"positions": positions[start:end]} for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _positions_to_array(positions: list[dict]) -> np.ndarray:
+  return np.array([[p["x"], p["y"], p["z"]] for p in positions], dtype=float).reshape(-1, 3)
+
+
+def _position_to_dict(position: list[float]) -> dict:
+  return {"x": position[0], "y": position[1], "z": position[2]}
+
+
+def _cache_snapshot(args: tuple[str, str, int]) -> None:
+  path_to_logs, cache_dir, idx = args
+  snapshot = parse_log_line(_open_log_file(path_to_logs)[idx])
+  np.savez(_snapshot_path(cache_dir, idx), **encode_snapshot(snapshot))
+
+
+def _snapshot_path(cache_dir: str, idx: int) -> str:
+  return os.path.join(cache_dir, f"snapshot_{idx:06d}.npz")
+
+
+def _is_cache_file(name: str) -> bool:
+  return name in ("manifest.json", "manifest.json.tmp") or (name.startswith("snapshot_") and name.endswith(".npz"))
+
+
+def _is_racy(mtime_ns: int, checked_ns: int) -> bool:
+  """Returns whether a file modified at `mtime_ns` may have been modified again after `checked_ns` without its
+  modification time changing."""
+  return mtime_ns + MTIME_GRANULARITY_NS >= checked_ns
+
+
+def _write_manifest(cache_dir: str, manifest: dict) -> None:
+  tmp_path = os.path.join(cache_dir, "manifest.json.tmp")
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    json.dump(manifest, f, indent=2)
+  os.replace(tmp_path, os.path.join(cache_dir, "manifest.json"))
+
+
+def _hash_file(path: str) -> str:
+  sha256 = hashlib.sha256()
+  with open(path, "rb") as f:
+    for block in iter(functools.partial(f.read, 1 << 20), b""):
+      sha256.update(block)
+  return sha256.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _open_log_file(path_to_logs: str) -> LogFile:
+  # Kept open for the lifetime of the process, so workers only load the log's index once
+  return LogFile(path_to_logs, persist_index=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _open_snapshot_cache(path_to_logs: str) -> SnapshotCache | None:
+  try:
+    return SnapshotCache(path_to_logs)
+  except _CACHE_ERRORS as e:
+    print(f"Could not use the snapshot cache of {path_to_logs}, parsing the log instead: {e}")
+    return None
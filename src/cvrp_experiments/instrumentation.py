@@ -0,0 +1,63 @@
+import contextlib
+import dataclasses
+import json
+import os
+import time
+from typing import Iterator
+
+
+@dataclasses.dataclass
+class PhaseRecord:
+  phase: str
+  start: float  # seconds since the epoch, so records from different processes share a time base
+  duration: float
+  snapshot_idx: int | None
+  pid: int
+
+
+class PhaseTimer:
+  """Records the wall time of named phases of processing a snapshot. A disabled timer records nothing."""
+
+  def __init__(self, snapshot_idx: int | None = None, enabled: bool = True) -> None:
+    self.snapshot_idx = snapshot_idx
+    self.enabled = enabled
+    self.records: list[PhaseRecord] = []
+
+  @contextlib.contextmanager
+  def phase(self, name: str) -> Iterator[None]:
+    if not self.enabled:
+      yield
+      return
+    start, start_counter = time.time(), time.perf_counter()
+    try:
+      yield
+    finally:
+      duration = time.perf_counter() - start_counter
+      self.records.append(PhaseRecord(name, start, duration, self.snapshot_idx, os.getpid()))
+
+
+def save_records(path: str, records: list[PhaseRecord]) -> None:
+  with open(path, "w", encoding="utf-8") as f:
+    json.dump([dataclasses.asdict(record) for record in records], f, indent=2)
+
+
+def save_timings(directory: str, stem: str, records: list[PhaseRecord]) -> None:
+  """Saves the records to `<stem>_timings.json` and as a Chrome trace to `<stem>_trace.json` in `directory`."""
+  os.makedirs(directory, exist_ok=True)
+  save_records(os.path.join(directory, stem + "_timings.json"), records)
+  save_chrome_trace(os.path.join(directory, stem + "_trace.json"), records)
+
+
+def save_chrome_trace(path: str, records: list[PhaseRecord]) -> None:
+  """Writes the records as complete events in the Chrome trace-event format, one track per worker process."""
+  events = [{
+      "name": record.phase,
+      "ph": "X",
+      "ts": record.start * 1e6,
+      "dur": record.duration * 1e6,
+      "pid": record.pid,
+      "tid": record.pid,
+      "args": {"snapshot_idx": record.snapshot_idx},
+  } for record in records]
+  with open(path, "w", encoding="utf-8") as f:
+    json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,34 @@
+import collections
+import os
+from concurrent import futures
+from typing import Any, Callable, Iterable, Iterator
+
+
+def default_num_workers() -> int:
+  """Returns the number of CPUs this process may run on."""
+  if hasattr(os, "sched_getaffinity"):
+    return len(os.sched_getaffinity(0))
+  return os.cpu_count() or 1
+
+
+def ordered_map(
+    fn: Callable[..., Any],
+    args_iter: Iterable[tuple],
+    max_workers: int | None = None,
+    max_in_flight: int | None = None,
+) -> Iterator[Any]:
+  """Applies `fn` to each tuple of arguments across a process pool, yielding the results in input order.
+
+  Arguments are only drawn from `args_iter` as results are consumed, so at most `max_in_flight` tasks (by default
+  twice the number of workers) are pending or buffered at once.
+  """
+  max_workers = max_workers or default_num_workers()
+  max_in_flight = max_in_flight or 2 * max_workers
+  with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+    pending: collections.deque[futures.Future] = collections.deque()
+    for args in args_iter:
+      pending.append(executor.submit(fn, *args))
+      if len(pending) >= max_in_flight:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
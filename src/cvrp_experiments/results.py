@@ -0,0 +1,52 @@
+import json
+import os
+
+
+class ResultStore:
+  """Append-only JSON-lines store of per-snapshot results, keyed by timestep and run configuration.
+
+  Each result is flushed as soon as it is added, so a run that crashes or is interrupted keeps everything solved so
+  far. A truncated last line, as left by a crash mid-write, is ignored when loading. An existing store is only
+  replaced with `overwrite`, so forgetting to resume can't discard it.
+  """
+
+  def __init__(self, path: str, config: dict, resume: bool = False, overwrite: bool = False) -> None:
+    self.path = path
+    self.config = config
+    self._config_key = json.dumps(config, sort_keys=True)
+    self.results = self._load() if resume else {}
+    if not resume and os.path.exists(path):
+      if not overwrite:
+        raise FileExistsError(f"{path} already holds results, continue it with resume or replace it with overwrite")
+      os.remove(path)
+
+  def __contains__(self, timestep: int) -> bool:
+    return timestep in self.results
+
+  def add(self, timestep: int, result: dict) -> None:
+    self.results[timestep] = result
+    record = {"timestep": timestep, "config": self._config_key, "result": result}
+    with open(self.path, "a", encoding="utf-8") as f:
+      f.write(json.dumps(record) + "\n")
+
+  def ordered_results(self) -> list[dict]:
+    return [self.results[timestep] for timestep in sorted(self.results)]
+
+  def _load(self) -> dict[int, dict]:
+    results: dict[int, dict] = {}
+    if not os.path.exists(self.path):
+      return results
+    with open(self.path, "r", encoding="utf-8") as f:
+      lines = f.readlines()
+    for line in lines:
+      try:
+        record = json.loads(line)
+      except json.JSONDecodeError:
+        continue
+      if record["config"] == self._config_key:
+        results[record["timestep"]] = record["result"]
+    if lines and not lines[-1].endswith("\n"):
+      # Terminate a truncated last line so the next result starts on a line of its own
+      with open(self.path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    return results
@@ -0,0 +1,235 @@
+import collections
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import process
+from typing import Callable, Iterable
+
+import numpy as np
+
+from cvrp_experiments import cvrp, parallel, synthetic
+
+# Solver options, and warm solvers with their last routes by session of the worker process, set up by _init_worker
+_worker_solver_kwargs: dict = {}
+_worker_sessions: collections.OrderedDict[str, tuple[cvrp.VrpSolver, list[list[int]]]] = collections.OrderedDict()
+_worker_max_sessions = 0
+
+
+class PlanningService:
+  """Plans routes for snapshots on a pool of resident worker processes.
+
+  Requests are dicts with a `snapshot` in the schema of the logs, and optionally an `id` echoed in the response, a
+  `session` and `with_path` to also return the current robot's path. Each worker imports OR-tools once and keeps the
+  solvers of its `max_sessions_per_worker` most recent sessions, so a session's next snapshot is solved with
+  `VrpSolver.update` instead of from scratch, and its search starts from the session's previous routes. Requests of
+  a session always run on the same worker, in the order they were submitted, while requests without one go to the
+  worker with the fewest pending requests.
+  """
+
+  def __init__(self, max_workers: int | None = None, max_sessions_per_worker: int = 16, **solver_kwargs) -> None:
+    """`solver_kwargs` are passed to every `cvrp.VrpSolver`, e.g. `search_options` or `joint`."""
+    self._solver_kwargs = solver_kwargs
+    self._max_sessions_per_worker = max_sessions_per_worker
+    # Single process executors, so that a worker and the solvers it keeps live as long as the service
+    self._executors = [self._make_executor() for _ in range(max_workers or parallel.default_num_workers())]
+    self._num_pending = [0] * len(self._executors)
+    self._session_workers: dict[str, int] = {}
+    self._lock = threading.Lock()
+
+  def __enter__(self) -> "PlanningService":
+    return self
+
+  def __exit__(self, *exc_info) -> None:
+    self.close()
+
+  def submit(self, request: dict) -> futures.Future:
+    """Schedules a request, returning a future of its response. Failed requests resolve to a response with an
+    `error` instead of raising."""
+    response_future: futures.Future = futures.Future()
+    with self._lock:
+      worker = self._pick_worker(request.get("session"))
+      self._num_pending[worker] += 1
+      try:
+        future = self._executors[worker].submit(_handle_request, request)
+      except process.BrokenProcessPool:
+        # The worker died, e.g. killed for running out of memory, so its sessions start over on a new one
+        self._executors[worker] = self._make_executor()
+        future = self._executors[worker].submit(_handle_request, request)
+
+    def on_done(future: futures.Future) -> None:
+      with self._lock:
+        self._num_pending[worker] -= 1
+      try:
+        response = future.result()
+      except Exception as e:  # pylint: disable=broad-except
+        response = {"error": f"{type(e).__name__}: {e}"}
+      response_future.set_result(_with_id(response, request))
+
+    future.add_done_callback(on_done)
+    return response_future
+
+  def submit_line(self, line: str) -> futures.Future:
+    """Schedules a request given as a line of JSON."""
+    try:
+      request = json.loads(line)
+      if not isinstance(request, dict) or "snapshot" not in request:
+        raise ValueError("Requests must be JSON objects with a snapshot")
+    except ValueError as e:
+      future: futures.Future = futures.Future()
+      future.set_result({"error": f"Invalid request: {e}"})
+      return future
+    return self.submit(request)
+
+  def close(self) -> None:
+    for executor in self._executors:
+      executor.shutdown()
+
+  def _make_executor(self) -> futures.ProcessPoolExecutor:
+    return futures.ProcessPoolExecutor(
+        max_workers=1,
+        initializer=_init_worker,
+        initargs=(self._solver_kwargs, self._max_sessions_per_worker),
+    )
+
+  def _pick_worker(self, session: str | None) -> int:
+    if session is not None and session in self._session_workers:
+      return self._session_workers[session]
+    worker = min(range(len(self._executors)), key=lambda i: self._num_pending[i])
+    if session is not None:
+      self._session_workers[session] = worker
+    return worker
+
+
+def serve_lines(service: PlanningService, lines: Iterable[str], write: Callable[[str], None]) -> None:
+  """Submits each line of JSON to `service` and writes each response as a line once it is ready.
+
+  Requests are solved concurrently, so responses may come out of order and are matched to requests by their `id`.
+  Returns after the last response is written.
+  """
+  condition = threading.Condition()
+  num_pending = 0
+
+  def write_response(future: futures.Future) -> None:
+    nonlocal num_pending
+    with condition:
+      write(json.dumps(future.result()) + "\n")
+      num_pending -= 1
+      condition.notify_all()
+
+  for line in lines:
+    if not line.strip():
+      continue
+    with condition:
+      num_pending += 1
+    service.submit_line(line).add_done_callback(write_response)
+  with condition:
+    condition.wait_for(lambda: num_pending == 0)
+
+
+def serve_unix_socket(service: PlanningService, path: str) -> None:
+  """Serves JSON-lines requests on a Unix socket at `path` until interrupted, with any number of clients at once."""
+  if os.path.exists(path):
+    os.remove(path)
+  with _UnixSocketServer(path, service) as server:
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      os.remove(path)
+
+
+class _UnixSocketServer(socketserver.ThreadingUnixStreamServer):
+  daemon_threads = True
+
+  def __init__(self, path: str, service: PlanningService) -> None:
+    self.service = service
+    super().__init__(path, _ConnectionHandler)
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+
+  def handle(self) -> None:
+
+    def write(line: str) -> None:
+      try:
+        self.wfile.write(line.encode())
+        self.wfile.flush()
+      except (OSError, ValueError):
+        # The client disconnected before its response was ready
+        pass
+
+    serve_lines(self.server.service, (line.decode() for line in self.rfile), write)
+
+
+def json_default(value):
+  """`default` for json.dumps, turning arrays of snapshots decoded from a data.SnapshotCache into lists."""
+  if isinstance(value, (np.ndarray, np.generic)):
+    return value.tolist()
+  raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _init_worker(solver_kwargs: dict, max_sessions: int) -> None:
+  global _worker_solver_kwargs, _worker_max_sessions  # pylint: disable=global-statement
+  _worker_solver_kwargs = solver_kwargs
+  _worker_max_sessions = max_sessions
+  # Solvers print warnings, which must not end up among the responses when the service answers on stdout
+  sys.stdout.flush()
+  os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+  # Loads OR-tools' routing library before the first request instead of during it
+  cvrp.VrpSolver(synthetic.make_snapshot(3, num_robots=1), True).solve_routes()
+
+
+def _handle_request(request: dict) -> dict:
+  start = time.perf_counter()
+  session = request.get("session")
+  solver, previous_routes = _worker_sessions.pop(session, (None, [])) if session is not None else (None, [])
+  warm = solver is not None
+  try:
+    if solver is None:
+      solver = cvrp.VrpSolver(request["snapshot"], True, **_worker_solver_kwargs)
+    else:
+      solver.update(request["snapshot"])
+    # Cells that are gone from the snapshot are dropped, the solver skips any that became unreachable
+    node_ids = set(request["snapshot"]["cell_or_robot_ids"])
+    initial_routes = [[node_id for node_id in route if node_id in node_ids] for route in previous_routes]
+    routes = solver.solve_routes(initial_routes or None)
+  except Exception as e:  # pylint: disable=broad-except
+    # The session's solver may be half updated, so its next snapshot is solved from scratch
+    return {"error": f"{type(e).__name__}: {e}"}
+  if session is not None:
+    # Without a solution, the next snapshot starts from the last routes found
+    _worker_sessions[session] = (solver, routes or previous_routes)
+    while len(_worker_sessions) > _worker_max_sessions:
+      _worker_sessions.popitem(last=False)
+  if not routes:
+    return {
+        "error": "No solution found",
+        "warm": warm,
+        "warm_start": solver.warm_started,
+        "solve_time_s": time.perf_counter() - start,
+    }
+  response = {
+      "routes": routes,
+      "route": routes[0],
+      "objective": solver.objective,
+      "distance": solver.distance,
+      "reward": solver.reward,
+      "penalty": solver.penalty,
+      "warm": warm,
+      "warm_start": solver.warm_started,
+      "solve_time_s": time.perf_counter() - start,
+  }
+  if request.get("with_path"):
+    response["path"] = solver.route_to_path(routes[0]).coordinates.tolist()
+  return response
+
+
+def _with_id(response: dict, request: dict) -> dict:
+  if "id" in request:
+    return {"id": request["id"], **response}
+  return response
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cvrp_experiments", "solutions")
+
+
+class SolutionCache:
+  """On-disk cache of solutions, stored as one JSON file per content hash.
+
+  Entries are evicted least recently used first once the cache grows beyond `max_bytes`, down to three quarters of
+  it. Reading an entry refreshes its modification time, which is used as its last access time. Safe to share between
+  processes.
+
+  The cache directory is only scanned once its size, estimated from the last scan and the entries written since,
+  exceeds `max_bytes`, or after this process wrote a sixteenth of `max_bytes`. Entries written by other processes are
+  not part of the estimate, so the cache can overshoot by up to that sixteenth per process sharing it.
+  """
+
+  def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = 256 * 1024**2) -> None:
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+    # Size of the cache at the last scan, None before the first one, and the bytes written by this process since
+    self._scanned_bytes: int | None = None
+    self._written_bytes = 0
+
+  def get(self, key: str) -> dict | None:
+    path = self._entry_path(key)
+    try:
+      with open(path, "r", encoding="utf-8") as f:
+        entry = json.load(f)
+      os.utime(path)
+    except (FileNotFoundError, json.JSONDecodeError):
+      return None
+    return entry
+
+  def put(self, key: str, entry: dict) -> None:
+    path = self._entry_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+      json.dump(entry, f)
+      self._written_bytes += f.tell()
+    os.replace(tmp_path, path)
+    if (
+        self._scanned_bytes is None or self._scanned_bytes + self._written_bytes > self.max_bytes
+        or self._written_bytes > self.max_bytes // 16
+    ):
+      self._evict()
+
+  def _evict(self) -> None:
+    entries = []
+    for name in os.listdir(self.cache_dir):
+      if not name.endswith(".json"):
+        continue
+      try:
+        stat = os.stat(os.path.join(self.cache_dir, name))
+      except FileNotFoundError:
+        continue
+      entries.append((stat.st_mtime_ns, stat.st_size, name))
+    total_bytes = sum(size for _, size, _ in entries)
+    target_bytes = total_bytes if total_bytes <= self.max_bytes else self.max_bytes * 3 // 4
+    for _, size, name in sorted(entries):
+      if total_bytes <= target_bytes:
+        break
+      try:
+        os.remove(os.path.join(self.cache_dir, name))
+      except FileNotFoundError:
+        pass
+      total_bytes -= size
+    self._scanned_bytes = total_bytes
+    self._written_bytes = 0
+
+  def _entry_path(self, key: str) -> str:
+    return os.path.join(self.cache_dir, f"{key}.json")
+
+
+def hash_key(*parts: bytes | str) -> str:
+  """Returns a hex digest over the given parts, delimited so that different splits of the same bytes differ."""
+  sha256 = hashlib.sha256()
+  for part in parts:
+    if isinstance(part, str):
+      part = part.encode("utf-8")
+    sha256.update(len(part).to_bytes(8, "little"))
+    sha256.update(part)
+  return sha256.hexdigest()
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+def make_snapshot(
+    num_cells: int,
+    num_robots: int = 3,
+    connection_density: float = 1.0,
+    poses_per_path: int = 5,
+    global_path_length: int = 50,
+    extent: float = 100.0,
+    seed: int = 0,
+    connect_all_robots: bool = False,
+) -> dict:
+  """Returns a random snapshot in the schema of the logs consumed by `cvrp.VrpSolver`.
+
+  Robots and cells are scattered uniformly over an `extent` sized square. The first robot, or every robot with
+  `connect_all_robots` for joint solves, is connected to every cell, and each pair of cells is connected with
+  probability `connection_density`, by a straight path of `poses_per_path` poses. The other robots each get a random
+  global plan of `global_path_length` poses.
+  """
+  rng = np.random.default_rng(seed)
+  robot_positions = rng.uniform(0, extent, (num_robots, 2))
+  cell_positions = rng.uniform(0, extent, (num_cells, 2))
+  robot_ids = list(range(num_robots))
+  cell_ids = list(range(num_robots, num_robots + num_cells))
+  connected_robots = num_robots if connect_all_robots else 1
+  connections = []
+  for i, cell_id in enumerate(cell_ids):
+    for robot_id, robot_position in zip(robot_ids[:connected_robots], robot_positions):
+      connections.append(_make_connection(robot_id, True, robot_position, cell_id, cell_positions[i], poses_per_path))
+    for j in np.flatnonzero(rng.random(i) < connection_density):
+      connections.append(_make_connection(cell_id, False, cell_positions[i], cell_ids[j], cell_positions[j],
+                                          poses_per_path))
+  return {
+      "robots": [{
+          "id": robot_id,
+          "position": _position(position),
+          "state_estimation": _position(position),
+      } for robot_id, position in zip(robot_ids, robot_positions)],
+      "cells": [{
+          "id": cell_id,
+          "position": _position(position),
+          "connection_point": _position(position),
+      } for cell_id, position in zip(cell_ids, cell_positions)],
+      "connections": connections,
+      "cell_or_robot_ids": robot_ids[:connected_robots] + cell_ids,
+      "is_node_robot": [True] * connected_robots + [False] * num_cells,
+      "other_robot_global_paths": [
+          _path(rng.uniform(0, extent, (global_path_length, 2))) for _ in range(num_robots - 1)
+      ],
+      "time_since_last_update": rng.uniform(5_000, 20_000, num_robots - 1).tolist(),
+      "vrp_solution": [],
+      "global_path": _path(np.empty((0, 2))),
+  }
+
+
+def _make_connection(
+    from_node_id: int,
+    is_from_node_robot: bool,
+    from_position: np.ndarray,
+    to_node_id: int,
+    to_position: np.ndarray,
+    num_poses: int,
+) -> dict:
+  return {
+      "from_node_id": from_node_id,
+      "is_from_node_robot": is_from_node_robot,
+      "to_node_id": to_node_id,
+      "is_to_node_robot": False,
+      "distance": int(np.linalg.norm(to_position - from_position)) + 1,
+      "path": _path(np.linspace(from_position, to_position, num_poses)),
+  }
+
+
+def _position(xy: np.ndarray) -> dict:
+  return {"x": float(xy[0]), "y": float(xy[1]), "z": 0.0}
+
+
+def _path(points: np.ndarray) -> dict:
+  return {"poses": [{"pose": {"position": _position(point)}} for point in points]}
@@ -1,9 +1,16 @@
 import dataclasses
+import operator
 
 import numpy as np
 
+# Upper bound on the number of point-segment pairs evaluated at once by min_segment_distances, small enough for the
+# intermediates to stay in cache
+_MAX_BATCH_ELEMENTS = 1 << 16
+# Coordinates of a logged position, in the order of a Path's columns
+_XYZ = operator.itemgetter("x", "y", "z")
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True)
 class Position:
   x: float
   y: float
@@ -17,6 +24,125 @@ class Position:
     return np.sqrt((self.x - other_position.x) ** 2 + (self.y - other_position.y) ** 2)
 
 
+def positions_to_xy(positions: list[Position]) -> np.ndarray:
+  return np.array([[position.x, position.y] for position in positions], dtype=float).reshape(-1, 2)
+
+
+def min_segment_distances(
+    points: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    group_offsets: list[int],
+) -> np.ndarray:
+  """Returns the minimum 2D distance from each of the (M, 2) points to each group of (N, 2) segments.
+
+  The segments run from `starts` to `ends` and form consecutive, non-empty groups beginning at `group_offsets`, so
+  the result is (M, len(group_offsets)). A zero-length segment measures the distance to its point.
+  """
+  points = np.asarray(points, dtype=float).reshape(-1, 2)
+  segments = ends - starts
+  lengths_sq = segments[:, 0] * segments[:, 0] + segments[:, 1] * segments[:, 1]
+  # Bound the (points, segments) intermediates for long paths queried over large grids
+  chunk_size = max(1, _MAX_BATCH_ELEMENTS // len(segments))
+  distances = np.empty((len(points), len(group_offsets)))
+  for chunk_start in range(0, len(points), chunk_size):
+    chunk = points[chunk_start:chunk_start + chunk_size]
+    distances_sq = _segment_distances_sq(chunk[:, :1], chunk[:, 1:], starts, segments, lengths_sq)
+    distances[chunk_start:chunk_start + chunk_size] = np.minimum.reduceat(distances_sq, group_offsets, axis=1)
+  return np.sqrt(distances, out=distances)
+
+
+class SegmentGrid:
+  """Uniform grid over 2D segments for finding the nearest segment within a fixed `radius` of query points.
+
+  Each grid cell lists the segments whose bounding box, inflated by `radius`, overlaps the cell. A point within
+  `radius` of a segment therefore finds it among the candidates of its own cell, and points outside every inflated
+  bounding box are answered without measuring any segment.
+  """
+  # Upper bound on the number of grid cells along each axis, for small radii around long paths
+  MAX_CELLS_PER_AXIS = 256
+
+  def __init__(self, starts: np.ndarray, ends: np.ndarray, radius: float) -> None:
+    self._starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    self._segments = np.asarray(ends, dtype=float).reshape(-1, 2) - self._starts
+    self._lengths_sq = self._segments[:, 0] * self._segments[:, 0] + self._segments[:, 1] * self._segments[:, 1]
+    # The margin keeps points at exactly `radius` inside the boxes despite rounding
+    inflation = radius * (1 + 1e-9) + 1e-9
+    lower = np.minimum(self._starts, self._starts + self._segments) - inflation
+    upper = np.maximum(self._starts, self._starts + self._segments) + inflation
+    self._origin = lower.min(axis=0)
+    extent = upper.max(axis=0) - self._origin
+    # Cells of half the radius keep the candidates close to the segments actually within the radius
+    self._cell_size = max(radius / 2, float(extent.max()) / self.MAX_CELLS_PER_AXIS)
+    self._shape = np.ceil(extent / self._cell_size).astype(int) + 1
+    first_cells = self._to_cells(lower)
+    last_cells = self._to_cells(upper)
+    # Enumerate the cells of every segment's box as (segment, cell) pairs and sort them into per-cell lists
+    widths = last_cells - first_cells + 1
+    counts = widths[:, 0] * widths[:, 1]
+    segment_ids = np.repeat(np.arange(len(counts)), counts)
+    ranks = np.arange(len(segment_ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cells_x = first_cells[segment_ids, 0] + ranks // widths[segment_ids, 1]
+    cells_y = first_cells[segment_ids, 1] + ranks % widths[segment_ids, 1]
+    cell_ids = cells_x * self._shape[1] + cells_y
+    order = np.argsort(cell_ids, kind="stable")
+    self._cell_segments = segment_ids[order]
+    self._cell_offsets = np.concatenate([[0], np.cumsum(np.bincount(cell_ids, minlength=np.prod(self._shape)))])
+
+  def min_distances(self, points: np.ndarray) -> np.ndarray:
+    """Returns the minimum distance from each of the (M, 2) points to the segments where it is at most the radius.
+
+    Elsewhere the result is some larger distance, or inf for points outside every inflated bounding box.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    distances_sq = np.full(len(points), np.inf)
+    cells = self._to_cells(points)
+    inside = np.flatnonzero(np.all((cells >= 0) & (cells < self._shape), axis=1))
+    cell_ids = cells[inside, 0] * self._shape[1] + cells[inside, 1]
+    counts = self._cell_offsets[cell_ids + 1] - self._cell_offsets[cell_ids]
+    inside, cell_ids, counts = inside[counts > 0], cell_ids[counts > 0], counts[counts > 0]
+    # Bound the number of (point, candidate segment) pairs measured at once
+    chunk_ends = np.searchsorted(np.cumsum(counts), np.arange(_MAX_BATCH_ELEMENTS, counts.sum(), _MAX_BATCH_ELEMENTS))
+    for chunk in np.split(np.arange(len(inside)), chunk_ends):
+      if len(chunk) == 0:
+        continue
+      chunk_counts = counts[chunk]
+      pair_offsets = np.cumsum(chunk_counts) - chunk_counts
+      ranks = np.arange(chunk_counts.sum()) - np.repeat(pair_offsets, chunk_counts)
+      segment_ids = self._cell_segments[np.repeat(self._cell_offsets[cell_ids[chunk]], chunk_counts) + ranks]
+      pair_points = points[np.repeat(inside[chunk], chunk_counts)]
+      pair_distances_sq = _segment_distances_sq(
+          pair_points[:, 0],
+          pair_points[:, 1],
+          self._starts[segment_ids],
+          self._segments[segment_ids],
+          self._lengths_sq[segment_ids],
+      )
+      distances_sq[inside[chunk]] = np.minimum.reduceat(pair_distances_sq, pair_offsets)
+    return np.sqrt(distances_sq, out=distances_sq)
+
+  def _to_cells(self, points: np.ndarray) -> np.ndarray:
+    return np.floor((points - self._origin) / self._cell_size).astype(int)
+
+
+def _segment_distances_sq(
+    x: np.ndarray,
+    y: np.ndarray,
+    starts: np.ndarray,
+    segments: np.ndarray,
+    lengths_sq: np.ndarray,
+) -> np.ndarray:
+  """Returns the squared distances between points and segments, broadcasting the point and segment arrays."""
+  dx = x - starts[:, 0]
+  dy = y - starts[:, 1]
+  projections = dx * segments[:, 0] + dy * segments[:, 1]
+  t = np.divide(projections, lengths_sq, out=np.zeros_like(projections), where=lengths_sq > 0)
+  np.clip(t, 0, 1, out=t)
+  dx -= t * segments[:, 0]
+  dy -= t * segments[:, 1]
+  return dx * dx + dy * dy
+
+
 @dataclasses.dataclass
 class Robot:
   position: Position
@@ -47,57 +173,87 @@ class Cell:
     )
 
 
-@dataclasses.dataclass
 class Path:
-  positions: list[Position]
+  """Polyline stored as an (N, 3) array of x, y, z coordinates.
+
+  The coordinates are a read-only view, so paths can share memory with each other (see `reversed`) and with the
+  arrays they were built from without being modified through one another.
+  """
+  __slots__ = ("coordinates",)
+
+  def __init__(self, positions: list[Position] | np.ndarray) -> None:
+    if isinstance(positions, np.ndarray):
+      coordinates = np.asarray(positions, dtype=float).reshape(-1, 3).view()
+    else:
+      coordinates = np.array([[p.x, p.y, p.z] for p in positions], dtype=float).reshape(-1, 3)
+    coordinates.flags.writeable = False
+    self.coordinates = coordinates
+
+  def __repr__(self) -> str:
+    return f"Path({self.positions!r})"
+
+  def __eq__(self, other: object) -> bool:
+    if not isinstance(other, Path):
+      return NotImplemented
+    return np.array_equal(self.coordinates, other.coordinates)
+
+  def __len__(self) -> int:
+    return len(self.coordinates)
+
+  @property
+  def positions(self) -> list[Position]:
+    return [Position(x, y, z) for x, y, z in self.coordinates.tolist()]
 
   @staticmethod
   def from_dict(data: dict) -> "Path":
-    positions_ = []
-    for pose in data["poses"]:
-      positions_.append(Position.from_dict(pose["pose"]["position"]))
-    return Path(positions_)
+    if "positions" in data:
+      # Paths decoded from a data.SnapshotCache hold an (N, 3) array instead of poses
+      return Path(np.asarray(data["positions"]))
+    coordinates = [[pose["pose"]["position"][axis] for axis in ("x", "y", "z")] for pose in data["poses"]]
+    return Path(np.array(coordinates, dtype=float))
+
+  @staticmethod
+  def concatenate(paths: list["Path"]) -> "Path":
+    """Joins paths end to end, copying each into a single preallocated array."""
+    coordinates = np.empty((sum(len(path) for path in paths), 3))
+    start = 0
+    for path in paths:
+      coordinates[start:start + len(path)] = path.coordinates
+      start += len(path)
+    return Path(coordinates)
 
   @staticmethod
   def from_vrp_solution(vrp_solution: list[int], cells: list[Cell]) -> "Path":
-    positions_ = []
-    for node_id in vrp_solution:
-      cell = next(c for c in cells if c.cell_id == node_id)
-      positions_.append(cell.position)
-    return Path(positions_)
+    cells_by_id = {}
+    for cell in cells:
+      cells_by_id.setdefault(cell.cell_id, cell)
+    return Path([cells_by_id[node_id].position for node_id in vrp_solution])
 
   def distance_to(self, other_position: Position) -> float:
-    if len(self.positions) == 0:
-      return 0
-    if len(self.positions) == 1:
-      return self.positions[0].distance_to(other_position)
-
-    def _is_p3_between_p1_and_p2(p1: Position, p2: Position, p3: Position) -> bool:
-      return (p1.x < p3.x and p3.x < p2.x) or (p1.x > p3.x and p3.x > p2.x) \
-        and (p1.y < p3.y and p3.y < p2.y) or (p1.y > p3.y and p3.y > p2.y)
-
-    def _calc_p3_prime(p1: Position, p2: Position, p3: Position) -> Position:
-      m = (p2.y - p1.y) / (p2.x - p1.x)
-      b = p1.y - m * p1.x
-      y3_ = m * p3.x + b
-      return Position(p3.x, y3_, p3.z)
-
-    p3 = other_position
-    distances = []
-    for i in range(len(self.positions) - 1):
-      p1, p2 = self.positions[i], self.positions[i+1]
-      if (p2.x - p1.x) != 0:
-        p3_ = _calc_p3_prime(p1, p2, p3)
-      else:
-        p3_ = Position(p1.x, p3.y, p3.z)
-      if _is_p3_between_p1_and_p2(p1, p2, p3_):
-        distances.append(p3_.distance_to(p3))
-      else:
-        distances.append(min([p1.distance_to(p3), p2.distance_to(p3)]))
-    return min(distances)
+    return float(self.distances_to(np.array([[other_position.x, other_position.y]]))[0])
+
+  def distances_to(self, points: np.ndarray) -> np.ndarray:
+    """Returns the minimum 2D distance from each of the (M, 2) query points to the polyline."""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(self.coordinates) == 0:
+      return np.zeros(len(points))
+    return min_segment_distances(points, *self.segments(), [0])[:, 0]
+
+  def segments(self) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the (N, 2) start and end points of the path's 2D segments, a single point for one vertex."""
+    vertices = self.coordinates[:, :2]
+    if len(vertices) == 1:
+      return vertices, vertices
+    return vertices[:-1], vertices[1:]
+
+  def reversed(self) -> "Path":
+    """Returns the path in reverse order as a view, without copying its coordinates."""
+    return Path(self.coordinates[::-1])
 
   def extend(self, path: "Path") -> "Path":
-    self.positions.extend(path.positions)
+    # Built through the constructor, so the extended coordinates are read-only as well
+    self.coordinates = Path.concatenate([self, path]).coordinates
+    return self
 
 
 @dataclasses.dataclass
@@ -140,13 +296,42 @@ class Connection:
     return node_type_1 == self.is_from_node_robot and node_type_2 == self.is_to_node_robot
 
 
+NodeKey = tuple[int, bool]
+
+
 @dataclasses.dataclass
 class Connections:
   connections: list[Connection]
+  _connection_index: dict[frozenset[NodeKey], Connection] = dataclasses.field(
+      init=False, repr=False, compare=False
+  )
+  _pairs_by_node: dict[NodeKey, list[frozenset[NodeKey]]] = dataclasses.field(
+      init=False, repr=False, compare=False
+  )
+
+  def __post_init__(self) -> None:
+    self._build_index()
 
   @staticmethod
-  def from_dict(data: dict) -> "Connections":
-    return Connections([Connection.from_dict(connection) for connection in data["connections"]])
+  def from_dict(data: dict, previous: "Connections | None" = None) -> "Connections":
+    """Parses the connections of a snapshot.
+
+    Connections of `previous` with the same endpoints, distance and path coordinates are taken over instead of being
+    parsed again, which makes `changed_distances` between the two proportional to what changed.
+    """
+    reusable = {}
+    if previous is not None:
+      reusable = {
+          (connection.from_node_id, connection.is_from_node_robot, connection.to_node_id, connection.is_to_node_robot):
+          connection for connection in previous.connections
+      }
+    connections = []
+    for source in data["connections"]:
+      connection = reusable.get(_connection_source_key(source))
+      if connection is None or not _connection_source_matches(source, connection):
+        connection = Connection.from_dict(source)
+      connections.append(connection)
+    return Connections(connections)
 
   def get_connection_distance(
       self,
@@ -155,12 +340,9 @@ class Connections:
       to_node_id: int,
       is_to_node_robot: bool,
   ) -> int:
-    for connection in self.connections:
-      if connection.connects_nodes(from_node_id, is_from_node_robot, to_node_id, is_to_node_robot):
-        return connection.distance
-    for connection in self.connections:
-      if connection.connects_nodes(to_node_id, is_to_node_robot, from_node_id, is_from_node_robot):
-        return connection.distance
+    connection = self._find_connection(from_node_id, is_from_node_robot, to_node_id, is_to_node_robot)
+    if connection is not None:
+      return connection.distance
     print(f"Could not find distance between nodes {from_node_id} and {to_node_id}")
     return 9999
 
@@ -169,12 +351,7 @@ class Connections:
       node_id: int,
       is_node_robot: bool,
   ) -> bool:
-    for connection in self.connections:
-      if connection.from_node_id == node_id and connection.is_from_node_robot == is_node_robot:
-        return True
-      if connection.to_node_id == node_id and connection.is_to_node_robot == is_node_robot:
-        return True
-    return False
+    return (node_id, is_node_robot) in self._pairs_by_node
 
   def get_path_between_nodes(
       self,
@@ -183,13 +360,73 @@ class Connections:
       to_node_id: int,
       is_to_node_robot: bool,
   ) -> Path:
+    connection = self._find_connection(from_node_id, is_from_node_robot, to_node_id, is_to_node_robot)
+    if connection is None:
+      print(f"Could not find path between nodes {from_node_id} and {to_node_id}")
+      return Path([])
+    if not connection.connects_nodes(from_node_id, is_from_node_robot, to_node_id, is_to_node_robot):
+      return connection.path.reversed()
+    return connection.path
+
+  def unique_connections(self) -> list[Connection]:
+    """Returns the connection used for each pair of connected nodes, in the order they were first seen."""
+    return list(self._connection_index.values())
+
+  def node_distances(self, node: NodeKey) -> dict[frozenset[NodeKey], int]:
+    """Returns the distance of the connection used for each pair of connected nodes including `node`."""
+    return {nodes: self._connection_index[nodes].distance for nodes in self._pairs_by_node.get(node, [])}
+
+  def changed_distances(self, previous: "Connections") -> dict[frozenset[NodeKey], int | None]:
+    """Returns the pairs of nodes whose connection was added, replaced or removed since `previous`.
+
+    Pairs map to the distance of their connection, or None if they are no longer connected. Connections are compared
+    by identity, so only those taken over by `from_dict` count as unchanged.
+    """
+    previous_index = previous._connection_index  # pylint: disable=protected-access
+    changed = {
+        nodes: connection.distance
+        for nodes, connection in self._connection_index.items()
+        if previous_index.get(nodes) is not connection
+    }
+    changed.update((nodes, None) for nodes in previous_index.keys() - self._connection_index.keys())
+    return changed
+
+  def _build_index(self) -> None:
+    """Indexes connections by their unordered endpoints, keeping the first connection per pair."""
+    self._connection_index = {}
+    self._pairs_by_node = {}
     for connection in self.connections:
-      if connection.connects_nodes(from_node_id, is_from_node_robot, to_node_id, is_to_node_robot):
-        return connection.path
-    for connection in self.connections:
-      if connection.connects_nodes(to_node_id, is_to_node_robot, from_node_id, is_from_node_robot):
-        path = connection.path
-        path.positions.reverse()
-        return path
-    print(f"Could not find path between nodes {from_node_id} and {to_node_id}")
-    return Path([])
+      from_node = (connection.from_node_id, connection.is_from_node_robot)
+      to_node = (connection.to_node_id, connection.is_to_node_robot)
+      nodes = frozenset((from_node, to_node))
+      if nodes in self._connection_index:
+        continue
+      self._connection_index[nodes] = connection
+      for node in nodes:
+        self._pairs_by_node.setdefault(node, []).append(nodes)
+
+  def _find_connection(
+      self,
+      from_node_id: int,
+      is_from_node_robot: bool,
+      to_node_id: int,
+      is_to_node_robot: bool,
+  ) -> Connection | None:
+    key = frozenset(((from_node_id, is_from_node_robot), (to_node_id, is_to_node_robot)))
+    return self._connection_index.get(key)
+
+
+def _connection_source_key(source: dict) -> tuple[int, bool, int, bool]:
+  return source["from_node_id"], source["is_from_node_robot"], source["to_node_id"], source["is_to_node_robot"]
+
+
+def _connection_source_matches(source: dict, connection: Connection) -> bool:
+  """Returns whether parsing `source` would give the distance and path of `connection`, which has its endpoints."""
+  if source["distance"] != connection.distance:
+    return False
+  path = source["path"]
+  if "positions" in path:
+    return np.array_equal(path["positions"], connection.path.coordinates)
+  # Comparing as flat lists of floats skips building the arrays, which dominates parsing
+  coordinates = [value for pose in path["poses"] for value in _XYZ(pose["pose"]["position"])]
+  return coordinates == connection.path.coordinates.ravel().tolist()
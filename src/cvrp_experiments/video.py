@@ -0,0 +1,164 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent import futures
+from typing import Callable
+
+import matplotlib
+import numpy as np
+import tqdm
+from PIL import Image, ImageSequence
+
+from cvrp_experiments import instrumentation, parallel, visualization
+
+
+class VideoWriter:
+  """Streams RGB frames into a video file.
+
+  GIFs are encoded with Pillow, which holds the palettized frames in memory until the writer is closed. Any other
+  format is encoded by piping the raw frames into ffmpeg, found through matplotlib's `animation.ffmpeg_path`.
+  """
+
+  def __init__(self, path: str, fps: float = 5) -> None:
+    self.path = path
+    self.fps = fps
+    self._gif_frames: list[Image.Image] = []
+    self._process: subprocess.Popen | None = None
+
+  def __enter__(self) -> "VideoWriter":
+    return self
+
+  def __exit__(self, *exc_info) -> None:
+    self.close()
+
+  def write(self, frame: np.ndarray) -> None:
+    """Appends an (H, W, 3) RGB frame. All frames must have the same size."""
+    if _is_gif(self.path):
+      self._gif_frames.append(Image.fromarray(frame).convert("P", palette=Image.Palette.ADAPTIVE))
+      return
+    if self._process is None:
+      self._process = _start_ffmpeg(self.path, frame.shape[1], frame.shape[0], self.fps)
+    self._process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+
+  def close(self) -> None:
+    if self._gif_frames:
+      _save_gif(self.path, self._gif_frames, self.fps)
+      self._gif_frames = []
+    if self._process is not None:
+      _, stderr = self._process.communicate()
+      if self._process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to write {self.path}: {stderr.decode(errors='replace')}")
+      self._process = None
+
+
+def render_video(
+    path: str,
+    make_frame: Callable[[int], visualization.Frame],
+    num_frames: int,
+    make_renderer: Callable[[], visualization.FrameRenderer],
+    fps: float = 5,
+    max_workers: int | None = None,
+    instrument: bool = False,
+) -> list[instrumentation.PhaseRecord]:
+  """Renders the frames `make_frame(0)` to `make_frame(num_frames - 1)` into a video at `path`.
+
+  The frames are split into one contiguous chunk per worker. Each worker draws its chunk on a single renderer from
+  `make_renderer` and encodes it into a file of its own, and the chunks are joined in order at the end. Both callables
+  must be picklable, e.g. module level functions or functools.partial objects of them. With `instrument`, returns
+  the time each frame spent in `make_frame`, rendering and encoding.
+  """
+  if num_frames == 0:
+    raise ValueError("There are no frames to render")
+  max_workers = min(max_workers or parallel.default_num_workers(), num_frames)
+  if max_workers == 1:
+    return _render_chunk(path, list(range(num_frames)), make_frame, make_renderer, fps, instrument, True)
+  chunks = [chunk.tolist() for chunk in np.array_split(np.arange(num_frames), max_workers)]
+  extension = os.path.splitext(path)[1]
+  with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmpdir:
+    chunk_paths = [os.path.join(tmpdir, f"chunk_{i}{extension}") for i in range(len(chunks))]
+    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+      chunk_futures = [
+          executor.submit(_render_chunk, chunk_path, chunk, make_frame, make_renderer, fps, instrument)
+          for chunk_path, chunk in zip(chunk_paths, chunks)
+      ]
+      records = []
+      for future in tqdm.tqdm(futures.as_completed(chunk_futures), total=len(chunk_futures)):
+        records.extend(future.result())
+    merge_videos(chunk_paths, path, fps)
+  return records
+
+
+def merge_videos(paths: list[str], output_path: str, fps: float = 5) -> None:
+  """Joins videos of the same format and frame size end to end. MP4 and other ffmpeg formats are not re-encoded."""
+  if _is_gif(output_path):
+    frames = []
+    for path in paths:
+      with Image.open(path) as gif:
+        frames.extend(frame.copy() for frame in ImageSequence.Iterator(gif))
+    _save_gif(output_path, frames, fps)
+    return
+  with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+    # The concat demuxer reads one "file '<path>'" line per input, with single quotes escaped
+    f.writelines("file '" + os.path.abspath(path).replace("'", "'\\''") + "'\n" for path in paths)
+  try:
+    subprocess.run(
+        [_ffmpeg_path(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", f.name, "-c", "copy",
+         output_path],
+        check=True,
+    )
+  finally:
+    os.remove(f.name)
+
+
+def _render_chunk(
+    path: str,
+    frame_indices: list[int],
+    make_frame: Callable[[int], visualization.Frame],
+    make_renderer: Callable[[], visualization.FrameRenderer],
+    fps: float,
+    instrument: bool = False,
+    show_progress: bool = False,
+) -> list[instrumentation.PhaseRecord]:
+  renderer = make_renderer()
+  records = []
+  with VideoWriter(path, fps) as writer:
+    for idx in tqdm.tqdm(frame_indices, disable=not show_progress):
+      timer = instrumentation.PhaseTimer(idx, enabled=instrument)
+      with timer.phase("make_frame"):
+        frame = make_frame(idx)
+      with timer.phase("render"):
+        image = renderer.render(frame)
+      with timer.phase("encode"):
+        writer.write(image)
+      records.extend(timer.records)
+  return records
+
+
+def _is_gif(path: str) -> bool:
+  return path.lower().endswith(".gif")
+
+
+def _save_gif(path: str, frames: list[Image.Image], fps: float) -> None:
+  frames[0].save(path, save_all=True, append_images=frames[1:], duration=int(1000 / fps), loop=0)
+
+
+def _ffmpeg_path() -> str:
+  ffmpeg_path = shutil.which(matplotlib.rcParams["animation.ffmpeg_path"])
+  if ffmpeg_path is None:
+    raise RuntimeError("ffmpeg was not found, so only GIFs can be written. Install it or set animation.ffmpeg_path")
+  return ffmpeg_path
+
+
+def _start_ffmpeg(path: str, width: int, height: int, fps: float) -> subprocess.Popen:
+  return subprocess.Popen(
+      [
+          _ffmpeg_path(), "-y", "-loglevel", "error",
+          "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+          # H.264 with yuv420p needs even frame sizes
+          "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-vcodec", "libx264", "-pix_fmt", "yuv420p",
+          path,
+      ],
+      stdin=subprocess.PIPE,
+      stderr=subprocess.PIPE,
+  )
@@ -1,6 +1,10 @@
 # pylint: disable=too-many-locals
+import dataclasses
+
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib import collections, figure
+from matplotlib.backends import backend_agg
 
 from cvrp_experiments import belief_state, types
 
@@ -57,13 +61,13 @@ def plot_cell(cell: types.Cell, plot_connection_point: bool = False, label: str
 
 
 def plot_path(path: types.Path, color: str = "#AAAAAA", label: str | None = None, end_color: str | None = None) -> None:
-  if len(path.positions) < 2:
+  if len(path) < 2:
     return
   ax = plt.gca()
-  x = [position.x for position in path.positions]
-  y = [position.y for position in path.positions]
+  x = path.coordinates[:, 0].tolist()
+  y = path.coordinates[:, 1].tolist()
   if end_color:
-    colors = _calc_color_gradient(color, end_color, len(path.positions) - 1)
+    colors = _calc_color_gradient(color, end_color, len(path) - 1)
     for x1, y1, x2, y2, color in zip(x[:-1], y[:-1], x[1:], y[1:], colors):  # pylint: disable=redefined-argument-from-local
       ax.plot([x1, x2], [y1, y2], color=color)
     ax.plot([x1, x2], [y1, y2], color=color, label=label)
@@ -85,23 +89,120 @@ def _calc_color_gradient(start_color: str, end_color: str, num_colors: int) -> l
 
 
 def plot_heatmap(
-    belief_state_: belief_state.BeliefState | belief_state.BeliefState,
+    belief_state_: belief_state.BeliefState | belief_state.AggregatedBeliefState,
     limits: list[float],
+    resolution: int = 100,
 ) -> None:
+  """Plots the likelihoods over the `limits` (xmin, xmax, ymin, ymax) sampled on a `resolution` square grid."""
   ax = plt.gca()
   xmin, xmax, ymin, ymax = limits
   y_arr, x_arr = np.meshgrid(
-      np.linspace(ymin, ymax, 100),
-      np.linspace(xmin, xmax, 100),
+      np.linspace(ymin, ymax, resolution),
+      np.linspace(xmin, xmax, resolution),
   )
-  z_arr = np.zeros_like(x_arr)
-  for i in range(x_arr.shape[0]):
-    for j in range(x_arr.shape[1]):
-      z_arr[i, j] = belief_state_.get_likelihood(types.Position(x_arr[i, j], y_arr[i, j], 0))
+  points = np.column_stack([x_arr.ravel(), y_arr.ravel()])
+  z_arr = belief_state_.get_likelihoods(points).reshape(x_arr.shape)
   zmin, zmax = np.min(z_arr), np.max(z_arr)
-  # ax.pcolormesh(x_arr, y_arr, z_arr, cmap='Blues', vmin=zmin, vmax=zmax)
-  cmap = "Reds"
-  ax.pcolormesh(x_arr, y_arr, z_arr, shading='auto', cmap=cmap, vmin=zmin, vmax=zmax)
-  c = ax.pcolormesh(x_arr, y_arr, z_arr, cmap=cmap, vmin=zmin, vmax=zmax)
+  c = ax.pcolormesh(x_arr, y_arr, z_arr, shading='auto', cmap="Reds", vmin=zmin, vmax=zmax)
   fig = plt.gcf()
   fig.colorbar(c, ax=ax)
+
+
+@dataclasses.dataclass
+class Frame:
+  """Contents of one frame drawn by FrameRenderer."""
+  current_robot: types.Robot
+  other_robots: list[types.Robot]
+  other_robot_global_paths: list[types.Path]
+  cells: list[types.Cell]
+  path: types.Path | None = None
+  aggregated_belief_state: belief_state.AggregatedBeliefState | None = None
+
+
+class FrameRenderer:  # pylint: disable=too-many-instance-attributes
+  """Draws frames on one persistent figure, updating the data of its artists in place instead of recreating them.
+
+  The axes are fixed to `limits` (xmin, xmax, ymin, ymax). With a `heatmap_resolution`, the frame's belief state is
+  drawn as a heatmap over the limits. The frame's path is drawn in `path_color`, fading to `path_end_color` if given.
+  """
+
+  def __init__(
+      self,
+      title: str,
+      limits: list[float],
+      heatmap_resolution: int | None = None,
+      path_color: str = "b",
+      path_end_color: str | None = None,
+      path_label: str = "Current robot's global path",
+      other_path_label: str = "Other robot's global path",
+      figsize: tuple[float, float] = (6.4, 4.8),
+      dpi: int = 100,
+  ) -> None:
+    self._figure = figure.Figure(figsize=figsize, dpi=dpi)
+    backend_agg.FigureCanvasAgg(self._figure)
+    ax = self._figure.add_subplot()
+    xmin, xmax, ymin, ymax = limits
+    self._heatmap = None
+    if heatmap_resolution is not None:
+      y_arr, x_arr = np.meshgrid(
+          np.linspace(ymin, ymax, heatmap_resolution),
+          np.linspace(xmin, xmax, heatmap_resolution),
+      )
+      self._heatmap_points = np.column_stack([x_arr.ravel(), y_arr.ravel()])
+      self._heatmap = ax.pcolormesh(x_arr, y_arr, np.zeros_like(x_arr), shading='auto', cmap="Reds")
+      self._figure.colorbar(self._heatmap, ax=ax)
+    self._path_color = path_color
+    self._path_end_color = path_end_color
+    self._other_paths = ax.add_collection(collections.LineCollection([], colors="r", label=other_path_label))
+    self._path = ax.add_collection(collections.LineCollection([], colors=path_color, label=path_label))
+    robot_style = {"marker": "^", "s": 115, "linewidths": 2, "c": "#0000"}
+    self._current_robot = ax.scatter([], [], edgecolors='b', label="Current robot's position", **robot_style)
+    self._other_robots = ax.scatter(
+        [], [], edgecolors='r', label="Other robot's position\nat last map update", **robot_style
+    )
+    self._state_estimations = ax.scatter([], [], edgecolors='g', label="Other robot's position", **robot_style)
+    self._estimation_errors = ax.add_collection(
+        collections.LineCollection(
+            [], colors='gray', linestyles='--', linewidths=2, label="Error in other robot position"
+        )
+    )
+    self._cells = ax.scatter([], [], color='k', marker='x', label="Cells to visit")
+    ax.set_xlim([xmin, xmax])
+    ax.set_ylim([ymin, ymax])
+    ax.legend(loc='lower right')
+    ax.set_xticklabels([])
+    ax.set_yticklabels([])
+    ax.tick_params(axis='both', which='both', length=0)
+    ax.set_title(title)
+    self._figure.tight_layout()
+
+  def render(self, frame: Frame) -> np.ndarray:
+    """Draws the frame and returns it as an (H, W, 3) RGB array."""
+    if self._heatmap is not None:
+      z_arr = np.zeros(len(self._heatmap_points))
+      if frame.aggregated_belief_state is not None:
+        z_arr = frame.aggregated_belief_state.get_likelihoods(self._heatmap_points)
+      self._heatmap.set_array(z_arr.reshape(self._heatmap.get_array().shape))
+      self._heatmap.set_clim(np.min(z_arr), np.max(z_arr))
+    self._other_paths.set_segments(
+        [path.coordinates[:, :2] for path in frame.other_robot_global_paths if len(path) >= 2]
+    )
+    self._update_path(frame.path)
+    self._current_robot.set_offsets(types.positions_to_xy([frame.current_robot.position]))
+    positions = types.positions_to_xy([robot.position for robot in frame.other_robots])
+    state_estimations = types.positions_to_xy([robot.state_estimation for robot in frame.other_robots])
+    self._other_robots.set_offsets(positions)
+    self._state_estimations.set_offsets(state_estimations)
+    self._estimation_errors.set_segments(np.stack([positions, state_estimations], axis=1))
+    self._cells.set_offsets(types.positions_to_xy([cell.position for cell in frame.cells]))
+    self._figure.canvas.draw()
+    return np.asarray(self._figure.canvas.buffer_rgba())[:, :, :3].copy()
+
+  def _update_path(self, path: types.Path | None) -> None:
+    if path is None or len(path) < 2:
+      self._path.set_segments([])
+      return
+    vertices = path.coordinates[:, :2]
+    self._path.set_segments(np.stack([vertices[:-1], vertices[1:]], axis=1))
+    if self._path_end_color:
+      self._path.set_color(_calc_color_gradient(self._path_color, self._path_end_color, len(path) - 1))
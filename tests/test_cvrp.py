@@ -0,0 +1,84 @@
+import copy
+
+import numpy as np
+import pytest
+
+from cvrp_experiments import cvrp, synthetic
+
+
+@pytest.mark.parametrize("connection_density", [1.0, 0.5])
+def test_distance_matrix_matches_reference(connection_density: float) -> None:
+  snapshot = synthetic.make_snapshot(30, connection_density=connection_density, seed=1)
+  vrp_solver = cvrp.VrpSolver(snapshot, silent_mode=True)
+  distance_matrix = vrp_solver._get_distance_matrix()  # pylint: disable=protected-access
+  reference = vrp_solver._calc_distance_matrix_reference()  # pylint: disable=protected-access
+  np.testing.assert_array_equal(distance_matrix, reference)
+
+
+def _change_distance(snapshot: dict) -> None:
+  snapshot["connections"][3]["distance"] += 17
+
+
+def _remove_connection(snapshot: dict) -> None:
+  snapshot["connections"].pop(5)
+
+
+def _move_cell(snapshot: dict) -> None:
+  snapshot["cells"][2]["position"]["x"] += 4.0
+
+
+def _drop_cell(snapshot: dict) -> None:
+  idx = snapshot["is_node_robot"].index(False)
+  snapshot["cell_or_robot_ids"].pop(idx)
+  snapshot["is_node_robot"].pop(idx)
+
+
+def _move_other_robot(snapshot: dict) -> None:
+  snapshot["robots"][1]["position"]["y"] += 6.0
+
+
+def _advance_time(snapshot: dict) -> None:
+  snapshot["time_since_last_update"] = [time_ms + 2_000 for time_ms in snapshot["time_since_last_update"]]
+
+
+def _shorten_plan(snapshot: dict) -> None:
+  snapshot["other_robot_global_paths"][0]["poses"] = snapshot["other_robot_global_paths"][0]["poses"][:-10]
+
+
+def _add_cell(snapshot: dict) -> None:
+  cell_id = max(cell["id"] for cell in snapshot["cells"]) + 1
+  position = {"x": 50.0, "y": 50.0, "z": 0.0}
+  snapshot["cells"].append({"id": cell_id, "position": position, "connection_point": position})
+  snapshot["cell_or_robot_ids"].append(cell_id)
+  snapshot["is_node_robot"].append(False)
+  for from_node_id, is_from_node_robot in [(snapshot["robots"][0]["id"], True), (snapshot["cells"][0]["id"], False)]:
+    snapshot["connections"].append({
+        "from_node_id": from_node_id,
+        "is_from_node_robot": is_from_node_robot,
+        "to_node_id": cell_id,
+        "is_to_node_robot": False,
+        "distance": 42,
+        "path": {"poses": []},
+    })
+
+
+@pytest.mark.parametrize("joint", [False, True])
+def test_update_matches_new_solver(joint: bool) -> None:
+  snapshot = synthetic.make_snapshot(25, 4, connection_density=0.6, connect_all_robots=joint)
+  vrp_solver = cvrp.VrpSolver(snapshot, silent_mode=True, joint=joint)
+  changes = [
+      _change_distance, _remove_connection, _move_cell, _drop_cell, _move_other_robot, _advance_time, _shorten_plan,
+      _add_cell
+  ]
+  for change in changes:
+    # Fill the caches that update carries over
+    vrp_solver._get_distance_matrix()  # pylint: disable=protected-access
+    vrp_solver._get_node_rewards()  # pylint: disable=protected-access
+    snapshot = copy.deepcopy(snapshot)
+    change(snapshot)
+    vrp_solver.update(snapshot)
+    new_solver = cvrp.VrpSolver(snapshot, silent_mode=True, joint=joint)
+    # pylint: disable=protected-access
+    np.testing.assert_array_equal(vrp_solver._get_distance_matrix(), new_solver._get_distance_matrix())
+    assert vrp_solver._get_node_rewards() == new_solver._get_node_rewards()
+  assert vrp_solver.solve_routes() == new_solver.solve_routes()
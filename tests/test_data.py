@@ -0,0 +1,67 @@
+import os
+
+import pytest
+import yaml
+
+from cvrp_experiments import cvrp, data, synthetic
+
+
+def _write_log(path: str, num_snapshots: int) -> None:
+  with open(path, "w", encoding="utf-8") as f:
+    for seed in range(num_snapshots):
+      snapshot = synthetic.make_snapshot(12, 3, connection_density=0.7, seed=seed)
+      snapshot["connections"][0]["distance"] = 111
+      f.write(yaml.safe_dump(snapshot) + data.DOCUMENT_SEPARATOR.decode())
+
+
+def _distances(snapshot: dict) -> list[int]:
+  return [connection["distance"] for connection in snapshot["connections"]]
+
+
+def test_snapshot_cache_gives_same_solutions_as_log(tmp_path) -> None:
+  path = str(tmp_path / "log.yaml")
+  _write_log(path, 3)
+  cache = data.SnapshotCache(path, max_workers=1)
+  assert len(cache) == 3
+  with data.LogFile(path) as logs:
+    for idx, log in enumerate(logs):
+      parsed_solver = cvrp.VrpSolver(data.parse_log_line(log), silent_mode=True)
+      cached_solver = cvrp.VrpSolver(cache[idx], silent_mode=True)
+      assert cached_solver.solve_routes() == parsed_solver.solve_routes()
+      assert cached_solver.objective == parsed_solver.objective
+
+
+def test_snapshot_cache_is_rebuilt_after_same_size_edit_within_mtime_granularity(tmp_path) -> None:
+  path = str(tmp_path / "log.yaml")
+  _write_log(path, 2)
+  assert data.SnapshotCache(path, max_workers=1)[0]["connections"][0]["distance"] == 111
+  stat = os.stat(path)
+  with open(path, "r+", encoding="utf-8") as f:
+    text = f.read().replace("distance: 111", "distance: 222", 1)
+    f.seek(0)
+    f.write(text)
+  # As if the edit happened within the same tick of a coarse file system clock
+  os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+  assert os.stat(path).st_size == stat.st_size
+  assert data.SnapshotCache(path, max_workers=1)[0]["connections"][0]["distance"] == 222
+
+
+def test_corrupt_snapshot_cache_is_rebuilt(tmp_path) -> None:
+  path = str(tmp_path / "log.yaml")
+  _write_log(path, 2)
+  cache = data.SnapshotCache(path, max_workers=1)
+  expected = _distances(cache[1])
+  with open(os.path.join(cache.cache_dir, "snapshot_000001.npz"), "r+b") as f:
+    f.truncate(100)
+  assert _distances(cache[1]) == expected
+  with open(os.path.join(cache.cache_dir, "manifest.json"), "w", encoding="utf-8") as f:
+    f.write('{"version": ')
+  assert _distances(data.SnapshotCache(path, max_workers=1)[1]) == expected
+
+
+def test_build_snapshot_cache_keeps_other_directories(tmp_path) -> None:
+  path = str(tmp_path / "log.yaml")
+  _write_log(path, 1)
+  with pytest.raises(FileExistsError):
+    data.build_snapshot_cache(path, str(tmp_path), max_workers=1)
+  assert os.path.exists(path)
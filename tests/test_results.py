@@ -0,0 +1,39 @@
+import pytest
+
+from cvrp_experiments import results
+
+CONFIG = {"logs": "log.yaml", "time_limit_s": 1.0}
+
+
+def test_resume_keeps_results_of_the_same_config(tmp_path) -> None:
+  path = str(tmp_path / "results.jsonl")
+  store = results.ResultStore(path, CONFIG)
+  store.add(1, {"reward": 10})
+  store.add(0, {"reward": 20})
+  results.ResultStore(path, {**CONFIG, "time_limit_s": 2.0}, resume=True).add(2, {"reward": 30})
+  resumed = results.ResultStore(path, CONFIG, resume=True)
+  assert 0 in resumed and 1 in resumed and 2 not in resumed
+  assert resumed.ordered_results() == [{"reward": 20}, {"reward": 10}]
+
+
+def test_existing_results_are_only_replaced_with_overwrite(tmp_path) -> None:
+  path = str(tmp_path / "results.jsonl")
+  results.ResultStore(path, CONFIG).add(0, {"reward": 10})
+  with pytest.raises(FileExistsError):
+    results.ResultStore(path, CONFIG)
+  assert 0 in results.ResultStore(path, CONFIG, resume=True)
+  results.ResultStore(path, CONFIG, overwrite=True)
+  assert not results.ResultStore(path, CONFIG, resume=True).results
+
+
+def test_truncated_last_line_is_ignored(tmp_path) -> None:
+  path = str(tmp_path / "results.jsonl")
+  store = results.ResultStore(path, CONFIG)
+  store.add(0, {"reward": 10})
+  store.add(1, {"reward": 20})
+  with open(path, "r+", encoding="utf-8") as f:
+    f.truncate(len(f.read()) - 5)
+  resumed = results.ResultStore(path, CONFIG, resume=True)
+  assert resumed.results == {0: {"reward": 10}}
+  resumed.add(1, {"reward": 30})
+  assert results.ResultStore(path, CONFIG, resume=True).results == {0: {"reward": 10}, 1: {"reward": 30}}
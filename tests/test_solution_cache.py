@@ -0,0 +1,23 @@
+import os
+
+from cvrp_experiments import solution_cache
+
+
+def _entry(key: str) -> dict:
+  return {"routes": [[0, 1, 2]], "key": key * 80}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path) -> None:
+  entry_bytes = len(str(_entry("a")))
+  cache = solution_cache.SolutionCache(str(tmp_path), max_bytes=int(3.5 * entry_bytes))
+  for i, key in enumerate("abc"):
+    cache.put(key, _entry(key))
+    # Distinct access times in the past, regardless of the file system's timestamp resolution
+    os.utime(os.path.join(str(tmp_path), f"{key}.json"), ns=(i * 10**9, i * 10**9))
+  assert cache.get("a") == _entry("a")
+  # Exceeding the limit evicts down to three quarters of it, least recently used first
+  cache.put("d", _entry("d"))
+  assert cache.get("b") is None
+  assert cache.get("c") is None
+  assert cache.get("a") == _entry("a")
+  assert cache.get("d") == _entry("d")
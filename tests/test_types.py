@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from cvrp_experiments import types
+
+
+@pytest.mark.parametrize("radius", [0.5, 5.0, 20.0])
+def test_segment_grid_matches_brute_force_within_radius(radius: float) -> None:
+  rng = np.random.default_rng(0)
+  # A random walk, as in global plans, plus a zero-length segment
+  starts = np.cumsum(rng.normal(0, 3, (200, 2)), axis=0)
+  ends = np.vstack([starts[1:], starts[-1:]])
+  points = rng.uniform(starts.min(axis=0) - 30, starts.max(axis=0) + 30, (5000, 2))
+  expected = types.min_segment_distances(points, starts, ends, [0])[:, 0]
+  distances = types.SegmentGrid(starts, ends, radius).min_distances(points)
+  within = expected <= radius
+  assert within.any() and not within.all()
+  np.testing.assert_array_equal(distances[within], expected[within])
+  assert np.all(distances[~within] > radius)
+
+
+def test_extended_path_stays_read_only() -> None:
+  path = types.Path(np.zeros((2, 3)))
+  path.extend(types.Path(np.ones((3, 3))))
+  np.testing.assert_array_equal(path.coordinates, np.vstack([np.zeros((2, 3)), np.ones((3, 3))]))
+  with pytest.raises(ValueError):
+    path.coordinates[0, 0] = 1.0
+
+
+def _distance_to_polyline(point: np.ndarray, vertices: np.ndarray) -> float:
+  """Projects the point onto each segment one at a time."""
+  distances = []
+  # A single vertex is a zero-length segment
+  segments = list(zip(vertices[:-1], vertices[1:])) or [(vertices[0], vertices[0])]
+  for start, end in segments:
+    segment = end - start
+    length_sq = float(segment @ segment)
+    t = 0.0 if length_sq == 0 else min(1.0, max(0.0, float((point - start) @ segment) / length_sq))
+    distances.append(float(np.linalg.norm(point - (start + t * segment))))
+  return min(distances)
+
+
+@pytest.mark.parametrize("num_vertices", [1, 2, 60])
+def test_path_distances_match_brute_force(num_vertices: int) -> None:
+  rng = np.random.default_rng(num_vertices)
+  coordinates = np.column_stack([np.cumsum(rng.normal(0, 3, (num_vertices, 2)), axis=0), rng.normal(size=num_vertices)])
+  if num_vertices > 2:
+    # A zero-length segment
+    coordinates[5] = coordinates[4]
+  path = types.Path(coordinates)
+  # Enough points to be measured in several chunks
+  points = rng.uniform(-40, 40, (3000, 2))
+  expected = [_distance_to_polyline(point, coordinates[:, :2]) for point in points]
+  np.testing.assert_allclose(path.distances_to(points), expected, rtol=1e-12, atol=1e-12)
+  assert path.distance_to(types.Position(*points[0], 0.0)) == pytest.approx(expected[0])
+
+
+def test_empty_path_distances_are_zero() -> None:
+  np.testing.assert_array_equal(types.Path(np.empty((0, 3))).distances_to(np.ones((4, 2))), np.zeros(4))